@@ -1,11 +1,59 @@
 import json
 import os
-from typing import List, Dict, Any, Optional
+import re
+import sys
+import math
+import time
+import zlib
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
 # Path to data files
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 CHATS_FILE = os.path.join(DATA_DIR, 'chats.json')
+CHAT_CHANGES_FILE = os.path.join(DATA_DIR, 'chat-changes.jsonl')
+CHAT_CHANGES_LOCK = os.path.join(DATA_DIR, 'chat-changes.lock')
+SEARCH_INDEX_FILE = os.path.join(DATA_DIR, 'chat-index.bin')
+SEARCH_TEXT_FILE = os.path.join(DATA_DIR, 'chat-index-text')
+
+# Bumped whenever the snapshot layout changes; other snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+
+# The delta is merged into the base once it holds this many documents or
+# this many feed bytes were applied since the last snapshot
+COMPACT_DELTA_DOCS = 20000
+COMPACT_FEED_BYTES = 8 * 1024 * 1024
+
+# A feed lock older than this was left by a writer that died holding it
+FEED_LOCK_STALE_SECONDS = 30
+
+# Wait before retrying a failed rebuild or compaction (seconds)
+MAINTENANCE_RETRY_SECONDS = 60
+
+# BM25 ranking parameters; chat names weigh more than message text
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_BOOST = 2.0
+SNIPPET_RADIUS = 60
+
+# Term weights are stored quantized to this many levels
+IMPACT_LEVELS = 255
+
+# Postings scored per step. Documents near the cut-off may have their
+# missing term weights read from their text instead of from more postings:
+# at least SEARCH_RESOLVE_LIMIT of them, and more while reading a text costs
+# less than the SEARCH_RESOLVE_RATIO postings each would otherwise save
+SEARCH_BLOCK = 256
+SEARCH_RESOLVE_LIMIT = 256
+SEARCH_RESOLVE_RATIO = 32
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
 
 def load_chats() -> List[Dict[str, Any]]:
     """Load all chat sessions from JSON file"""
@@ -99,6 +147,7 @@ def create_chat(chat_data: Dict[str, Any]) -> Dict[str, Any]:
     
     chats.append(new_chat)
     save_chats(chats)
+    _record_change({'op': 'put', 'chat': new_chat})
     return new_chat
 
 def update_chat(chat_id: str, chat_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -122,6 +171,7 @@ def update_chat(chat_id: str, chat_data: Dict[str, Any]) -> Optional[Dict[str, A
             })
             
             save_chats(chats)
+            _record_change({'op': 'put', 'chat': chats[i]})
             return chats[i]
     
     return None
@@ -134,6 +184,7 @@ def delete_chat(chat_id: str) -> bool:
     
     if len(chats) < initial_count:
         save_chats(chats)
+        _record_change({'op': 'delete', 'chatId': chat_id})
         return True
     return False
 
@@ -155,6 +206,871 @@ def add_message_to_chat(chat_id: str, message: Dict[str, Any]) -> Optional[Dict[
             chats[i]['updatedAt'] = datetime.now()
             
             save_chats(chats)
+            _record_change({'op': 'message', 'chatId': chat_id, 'message': message})
             return chats[i]
     
-    return None
\ No newline at end of file
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Full-text search index
+#
+# An inverted index over chat names and message contents. Chats are written
+# by the Node server (and by the functions above), both of which append each
+# change to CHAT_CHANGES_FILE. The index applies new lines from that feed
+# before every search, so keeping it current costs only the new changes.
+#
+# Postings are packed into typed arrays and ordered by impact, a BM25 term
+# weight quantized to IMPACT_LEVELS, so a search reads the strongest
+# postings first and stops once the requested page can no longer change.
+# The index has a large read-only base, loaded straight from the snapshot,
+# and a small sorted delta of documents added since. While a compaction
+# merges the delta into a new base, the old delta stays searchable as the
+# frozen layer.
+#
+# Message text is kept out of memory in an append-only text file; snippets
+# are read from it for the returned page only.
+# ---------------------------------------------------------------------------
+
+# Document flags; a dead document keeps its number until the next rebuild
+DOC_DEAD, DOC_MESSAGE, DOC_NAME = 0, 1, 2
+
+# Index layers a document number can fall in
+LAYER_BASE, LAYER_FROZEN, LAYER_DELTA = 0, 1, 2
+
+# A posting is one int64, (IMPACT_LEVELS - impact) << DOC_BITS | document,
+# so sorting a term's postings puts the strongest first
+DOC_BITS = 32
+DOC_MASK = (1 << DOC_BITS) - 1
+MAX_WEIGHT = (BM25_K1 + 1) * NAME_BOOST
+
+# Search cursor fields
+CURSOR_POS, CURSOR_END, CURSOR_POSTINGS, CURSOR_UNIT, CURSOR_BIT, CURSOR_LAYER = range(6)
+
+SNAPSHOT_FIELDS = ('feedInode', 'feedOffset', 'textFile', 'avgLength', 'docCount',
+                   'totalLength', 'liveTextBytes', 'chatIds')
+DOC_ARRAYS = ('docChat', 'docKey', 'docLength', 'docCrc', 'docTextAt', 'docTextLen', 'docFlags')
+SNAPSHOT_ARRAYS = DOC_ARRAYS + ('chatStarts', 'chatDocList', 'termStarts', 'postings')
+
+class SearchIndexBuilding(Exception):
+    """Raised while the search index is being built for the first time"""
+
+_index_lock = threading.RLock()
+_index: Optional[Dict[str, Any]] = None
+# Rebuilds and compactions run one at a time on a background thread
+_maintenance = {"thread": None, "rebuild": False, "retryAt": 0.0}
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms"""
+    return TOKEN_RE.findall(text.lower())
+
+def _term_counts(text: str) -> Tuple[Dict[str, int], int]:
+    """Count each term in a text; returns the counts and the text's length in terms"""
+    tokens = _tokenize(text)
+    counts: Dict[str, int] = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return counts, len(tokens)
+
+@contextmanager
+def _feed_lock():
+    """
+    Hold the lock that server.js also takes around each append, so the feed
+    is never rotated while a line is being written. The lock is a directory
+    because mkdir is atomic for both processes.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    while True:
+        try:
+            os.mkdir(CHAT_CHANGES_LOCK)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(CHAT_CHANGES_LOCK).st_mtime > FEED_LOCK_STALE_SECONDS:
+                    os.rmdir(CHAT_CHANGES_LOCK)
+                    continue
+            except OSError:
+                pass
+            time.sleep(0.005)
+    try:
+        yield
+    finally:
+        try:
+            os.rmdir(CHAT_CHANGES_LOCK)
+        except OSError:
+            pass
+
+def _record_change(change: Dict[str, Any]):
+    """Append a chat change to the feed the search index reads from"""
+    try:
+        line = json.dumps(change, ensure_ascii=False, default=str) + '\n'
+        with _feed_lock():
+            with open(CHAT_CHANGES_FILE, 'a') as f:
+                f.write(line)
+    except Exception as e:
+        print(f"Error recording chat change: {e}")
+
+def _feed_inode() -> Optional[int]:
+    try:
+        return os.stat(CHAT_CHANGES_FILE).st_ino
+    except OSError:
+        return None
+
+def _new_index(text_file: str, avg_length: float) -> Dict[str, Any]:
+    """Create an empty index; new documents go to the delta"""
+    return {
+        'feedInode': None,
+        'feedOffset': 0,
+        'textFile': text_file,
+        # Fixed when the index is built, so stored impacts stay comparable
+        'avgLength': avg_length,
+        'docCount': 0,
+        'totalLength': 0,
+        'liveTextBytes': 0,
+        'chatIds': [],
+        # Per document, indexed by document number
+        'docChat': array('i'),
+        # crc32 of the message id, so finding a message rarely reads text
+        'docKey': array('I'),
+        'docLength': array('I'),
+        'docCrc': array('I'),
+        'docTextAt': array('q'),
+        'docTextLen': array('I'),
+        'docFlags': array('B'),
+        # Live documents grouped by chat number, as of the snapshot
+        'chatStarts': array('q', [0]),
+        'chatDocList': array('i'),
+        # Base postings: terms[i] owns postings[termStarts[i]:termStarts[i + 1]]
+        'terms': [],
+        'termStarts': array('q', [0]),
+        'postings': array('q'),
+        # Not persisted
+        'chatNumbers': {},
+        'chatDocs': {},
+        'baseEnd': 0,
+        'deltaStart': 0,
+        'delta': {},
+        'dead': {},
+        'frozen': None,
+        'frozenDead': {},
+        'bulk': False,
+        'text': None,
+    }
+
+def _open_text_file(index: Dict[str, Any]):
+    """Open the index's text file for appending and random reads"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    index['text'] = open(os.path.join(DATA_DIR, index['textFile']), 'a+b')
+
+def _next_text_file() -> str:
+    """Name a text file generation newer than any on disk"""
+    prefix = os.path.basename(SEARCH_TEXT_FILE) + '.'
+    generations = [int(name[len(prefix):]) for name in os.listdir(DATA_DIR)
+                   if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    return f"{prefix}{max(generations, default=-1) + 1}"
+
+def _remove_old_text_files(current: str):
+    """Delete text files from before the current generation"""
+    prefix = os.path.basename(SEARCH_TEXT_FILE) + '.'
+    generation = int(current.rpartition('.')[2])
+    for name in os.listdir(DATA_DIR):
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit() and int(suffix) < generation:
+            os.remove(os.path.join(DATA_DIR, name))
+
+def _read_doc(index: Dict[str, Any], doc: int) -> List[Any]:
+    """Read a document's [message id, text] from the text file"""
+    text_file = index['text']
+    text_file.seek(index['docTextAt'][doc])
+    return json.loads(text_file.read(index['docTextLen'][doc]))
+
+def _impact(index: Dict[str, Any], tf: int, length: int, flag: int) -> int:
+    """Quantize a document's BM25 term weight to 1..IMPACT_LEVELS"""
+    weight = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / index['avgLength']))
+    if flag == DOC_NAME:
+        weight *= NAME_BOOST
+    return max(1, min(IMPACT_LEVELS, round(weight * IMPACT_LEVELS / MAX_WEIGHT)))
+
+def _posting(impact: int, doc: int) -> int:
+    return ((IMPACT_LEVELS - impact) << DOC_BITS) | doc
+
+def _doc_layer(index: Dict[str, Any], doc: int) -> int:
+    if doc < index['baseEnd']:
+        return LAYER_BASE
+    return LAYER_FROZEN if doc < index['deltaStart'] else LAYER_DELTA
+
+def _chat_number(index: Dict[str, Any], chat_id: str) -> int:
+    chat_no = index['chatNumbers'].get(chat_id)
+    if chat_no is None:
+        chat_no = len(index['chatIds'])
+        index['chatIds'].append(chat_id)
+        index['chatNumbers'][chat_id] = chat_no
+    return chat_no
+
+def _chat_docs(index: Dict[str, Any], chat_no: int, keep: bool = True) -> array:
+    """
+    Get a chat's live documents. Chats changed since the snapshot keep their
+    own list; the rest are read from the snapshot's grouping.
+    """
+    docs = index['chatDocs'].get(chat_no)
+    if docs is None:
+        starts, flags = index['chatStarts'], index['docFlags']
+        docs = array('i')
+        if chat_no + 1 < len(starts):
+            docs.extend(doc for doc in index['chatDocList'][starts[chat_no]:starts[chat_no + 1]] if flags[doc])
+        if keep:
+            index['chatDocs'][chat_no] = docs
+    return docs
+
+def _doc_key(message_id: str) -> int:
+    return zlib.crc32(message_id.encode('utf-8'))
+
+def _find_doc(index: Dict[str, Any], chat_no: int, message_id: Optional[str]) -> Optional[int]:
+    """Find a chat's document for a message id, or for its name if None"""
+    flags, keys = index['docFlags'], index['docKey']
+    key = _doc_key(message_id) if message_id is not None else None
+    for doc in _chat_docs(index, chat_no):
+        if message_id is None:
+            if flags[doc] == DOC_NAME:
+                return doc
+        elif flags[doc] == DOC_MESSAGE and keys[doc] == key and _read_doc(index, doc)[0] == message_id:
+            return doc
+    return None
+
+def _add_doc(index: Dict[str, Any], chat_no: int, message_id: Optional[str], flag: int, text: str):
+    """Add a document to the delta and its text to the text file"""
+    data = json.dumps([message_id, text], ensure_ascii=False).encode('utf-8')
+    text_file = index['text']
+    text_file.seek(0, os.SEEK_END)
+    offset = text_file.tell()
+    text_file.write(data)
+
+    counts, length = _term_counts(text)
+    doc = len(index['docFlags'])
+    index['docChat'].append(chat_no)
+    index['docKey'].append(_doc_key(message_id) if message_id is not None else 0)
+    index['docLength'].append(length)
+    index['docCrc'].append(zlib.crc32(text.encode('utf-8')))
+    index['docTextAt'].append(offset)
+    index['docTextLen'].append(len(data))
+    index['docFlags'].append(flag)
+    index['docCount'] += 1
+    index['totalLength'] += length
+    index['liveTextBytes'] += len(data)
+
+    _chat_docs(index, chat_no).append(doc)
+
+    delta = index['delta']
+    for term, tf in counts.items():
+        posting = _posting(_impact(index, tf, length, flag), doc)
+        postings = delta.get(term)
+        if postings is None:
+            delta[term] = array('q', [posting])
+        elif index['bulk']:
+            # A rebuild sorts every term once at the end
+            postings.append(posting)
+        else:
+            insort(postings, posting)
+
+def _remove_doc(index: Dict[str, Any], doc: int):
+    """Remove a document; postings in the base stay behind, counted as dead"""
+    flags = index['docFlags']
+    if not flags[doc]:
+        return
+
+    counts, length = _term_counts(_read_doc(index, doc)[1])
+    if doc >= index['deltaStart']:
+        delta = index['delta']
+        for term, tf in counts.items():
+            postings = delta[term]
+            postings.remove(_posting(_impact(index, tf, length, flags[doc]), doc))
+            if not postings:
+                del delta[term]
+    else:
+        dead = index['dead']
+        for term in counts:
+            dead[term] = dead.get(term, 0) + 1
+
+    flags[doc] = DOC_DEAD
+    index['docCount'] -= 1
+    index['totalLength'] -= length
+    index['liveTextBytes'] -= index['docTextLen'][doc]
+
+    _chat_docs(index, index['docChat'][doc]).remove(doc)
+
+def _put_doc(index: Dict[str, Any], chat_no: int, message_id: Optional[str], flag: int, text: str,
+             doc: Optional[int]):
+    """Add a document or replace `doc`, skipping it if its text is unchanged"""
+    if doc is not None:
+        if index['docCrc'][doc] == zlib.crc32(text.encode('utf-8')):
+            return
+        _remove_doc(index, doc)
+    _add_doc(index, chat_no, message_id, flag, text)
+
+def _message_id(message: Dict[str, Any], position: int) -> str:
+    return str(message.get('id') or position)
+
+def _chat_texts(chat: Dict[str, Any]) -> Dict[Optional[str], Tuple[int, str]]:
+    """A chat's documents by message id (None for the name); later duplicates win"""
+    texts = {None: (DOC_NAME, chat.get('name') or '')}
+    for i, message in enumerate(chat.get('messages') or []):
+        texts[_message_id(message, i)] = (DOC_MESSAGE, message.get('content') or '')
+    return texts
+
+def _apply_change(index: Dict[str, Any], change: Dict[str, Any]):
+    """Apply one feed entry to the index"""
+    op = change.get('op')
+    if op == 'put':
+        chat = change['chat']
+        chat_no = _chat_number(index, chat['id'])
+        wanted = _chat_texts(chat)
+        wanted_keys = {_doc_key(message_id) for message_id in wanted if message_id is not None}
+        flags, keys = index['docFlags'], index['docKey']
+        existing: Dict[Optional[str], int] = {}
+        for doc in list(_chat_docs(index, chat_no)):
+            if flags[doc] == DOC_NAME:
+                message_id = None
+            elif keys[doc] in wanted_keys:
+                message_id = _read_doc(index, doc)[0]
+            else:
+                _remove_doc(index, doc)
+                continue
+            if message_id in wanted and message_id not in existing:
+                existing[message_id] = doc
+            else:
+                _remove_doc(index, doc)
+        for message_id, (flag, text) in wanted.items():
+            _put_doc(index, chat_no, message_id, flag, text, existing.get(message_id))
+    elif op == 'message':
+        chat_no = _chat_number(index, change['chatId'])
+        message = change['message']
+        position = len(_chat_docs(index, chat_no)) - (_find_doc(index, chat_no, None) is not None)
+        message_id = _message_id(message, position)
+        _put_doc(index, chat_no, message_id, DOC_MESSAGE, message.get('content') or '',
+                 _find_doc(index, chat_no, message_id))
+    elif op == 'delete':
+        chat_no = index['chatNumbers'].get(change['chatId'])
+        if chat_no is not None:
+            for doc in list(_chat_docs(index, chat_no)):
+                _remove_doc(index, doc)
+
+def _read_feed(index: Dict[str, Any], offset: int) -> int:
+    """Apply complete feed lines after `offset`; returns the new offset"""
+    try:
+        with open(CHAT_CHANGES_FILE, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return offset
+
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        try:
+            _apply_change(index, json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # Skip a malformed entry rather than stalling the feed
+            continue
+    return offset + end
+
+def _average_length(chats: List[Dict[str, Any]], sample: int = 10000) -> float:
+    """Estimate the average document length in terms from a sample of messages"""
+    texts = [chat.get('name') or '' for chat in chats[:sample]]
+    step = max(sum(len(chat.get('messages') or []) for chat in chats) // sample, 1)
+    count = 0
+    for chat in chats:
+        for message in chat.get('messages') or []:
+            if count % step == 0:
+                texts.append(message.get('content') or '')
+            count += 1
+    return max(sum(len(_tokenize(text)) for text in texts) / max(len(texts), 1), 1.0)
+
+def _group_chats(chat_count: int, doc_chat: array, flags: array) -> Tuple[array, array]:
+    """Group live documents by chat number, as (starts, documents) arrays"""
+    starts = array('q', bytes(8 * (chat_count + 1)))
+    for doc, chat_no in enumerate(doc_chat):
+        if flags[doc]:
+            starts[chat_no + 1] += 1
+    for chat_no in range(chat_count):
+        starts[chat_no + 1] += starts[chat_no]
+
+    positions = array('q', starts)
+    docs = array('i', bytes(4 * starts[-1]))
+    for doc, chat_no in enumerate(doc_chat):
+        if flags[doc]:
+            docs[positions[chat_no]] = doc
+            positions[chat_no] += 1
+    return starts, docs
+
+def _write_snapshot(snapshot: Dict[str, Any]):
+    """Write the base and document tables as a JSON header line followed by raw arrays"""
+    terms = '\n'.join(snapshot['terms']).encode('utf-8')
+    header = {field: snapshot[field] for field in SNAPSHOT_FIELDS}
+    header.update({
+        'version': SNAPSHOT_VERSION,
+        'byteorder': sys.byteorder,
+        'termsBytes': len(terms),
+        'arrays': {name: [snapshot[name].typecode, len(snapshot[name])] for name in SNAPSHOT_ARRAYS}
+    })
+
+    tmp_file = f"{SEARCH_INDEX_FILE}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+        f.write(terms)
+        for name in SNAPSHOT_ARRAYS:
+            snapshot[name].tofile(f)
+    os.replace(tmp_file, SEARCH_INDEX_FILE)
+
+def _load_index() -> bool:
+    """Load the snapshot; returns False if there is no usable one"""
+    global _index
+    try:
+        with open(SEARCH_INDEX_FILE, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != SNAPSHOT_VERSION or header.get('byteorder') != sys.byteorder:
+                return False
+            index = _new_index(header['textFile'], header['avgLength'])
+            for field in SNAPSHOT_FIELDS:
+                index[field] = header[field]
+            terms = f.read(header['termsBytes']).decode('utf-8')
+            index['terms'] = terms.split('\n') if terms else []
+            for name in SNAPSHOT_ARRAYS:
+                # Read straight into the array, without a copy of the bytes
+                typecode, count = header['arrays'][name]
+                values = array(typecode, [0]) * count
+                if f.readinto(memoryview(values).cast('B')) != count * values.itemsize:
+                    return False
+                index[name] = values
+    except (OSError, ValueError, KeyError):
+        return False
+
+    if not os.path.exists(os.path.join(DATA_DIR, index['textFile'])):
+        return False
+
+    index['chatNumbers'] = {chat_id: chat_no for chat_no, chat_id in enumerate(index['chatIds'])}
+    index['baseEnd'] = index['deltaStart'] = len(index['docFlags'])
+    _open_text_file(index)
+    _index = index
+    return True
+
+def _rebuild_index():
+    """Build a new index from chats.json without holding the lock, then swap it in"""
+    global _index
+    os.makedirs(DATA_DIR, exist_ok=True)
+    open(CHAT_CHANGES_FILE, 'a').close()
+    # Take the feed position first: replaying changes that chats.json
+    # already contains is harmless, missing one is not
+    inode, offset = _feed_inode(), os.path.getsize(CHAT_CHANGES_FILE)
+    chats = load_chats()
+
+    index = _new_index(_next_text_file(), _average_length(chats))
+    index['bulk'] = True
+    _open_text_file(index)
+    for chat in chats:
+        if chat.get('id') in index['chatNumbers']:
+            _apply_change(index, {'op': 'put', 'chat': chat})
+            continue
+        chat_no = _chat_number(index, chat.get('id'))
+        for message_id, (flag, text) in _chat_texts(chat).items():
+            _add_doc(index, chat_no, message_id, flag, text)
+    del chats
+
+    # Sort the collected postings into the base
+    delta = index['delta']
+    for term in sorted(delta):
+        index['terms'].append(term)
+        index['postings'].extend(sorted(delta.pop(term)))
+        index['termStarts'].append(len(index['postings']))
+    for chat_no in range(len(index['chatIds'])):
+        index['chatDocList'].extend(index['chatDocs'].get(chat_no, ()))
+        index['chatStarts'].append(len(index['chatDocList']))
+    index.update(chatDocs={}, bulk=False, feedInode=inode, feedOffset=offset)
+    index['baseEnd'] = index['deltaStart'] = len(index['docFlags'])
+    index['text'].flush()
+    _write_snapshot(index)
+
+    with _index_lock:
+        if _feed_inode() == inode:
+            index['feedOffset'] = _read_feed(index, offset)
+        old, _index = _index, index
+        _maintenance['rebuild'] = False
+    if old is not None:
+        old['text'].close()
+    _remove_old_text_files(index['textFile'])
+    print(f"✅ Search index built with {index['docCount']} documents")
+
+def _merge_sorted(old: array, new: array) -> array:
+    """
+    Merge a few sorted postings into many. Copying the runs between them
+    in slices, rather than sorting everything, never holds the GIL for long.
+    """
+    merged = array('q')
+    start = 0
+    for posting in new:
+        end = bisect_left(old, posting, start)
+        merged.extend(old[start:end])
+        merged.append(posting)
+        start = end
+    merged.extend(old[start:])
+    return merged
+
+def _merge_postings(index: Dict[str, Any], frozen: Dict[str, array], dead_terms: set,
+                    flags: array) -> Tuple[List[str], array, array]:
+    """Merge the frozen delta into the base postings, dropping dead documents"""
+    old_terms, old_starts, old_postings = index['terms'], index['termStarts'], index['postings']
+    new_terms = sorted(frozen)
+    terms: List[str] = []
+    starts = array('q', [0])
+    postings = array('q')
+
+    i = j = 0
+    while i < len(old_terms) or j < len(new_terms):
+        if j == len(new_terms) or (i < len(old_terms) and old_terms[i] < new_terms[j]):
+            term, old, new = old_terms[i], i, None
+            i += 1
+        elif i == len(old_terms) or new_terms[j] < old_terms[i]:
+            term, old, new = new_terms[j], None, frozen[new_terms[j]]
+            j += 1
+        else:
+            term, old, new = old_terms[i], i, frozen[new_terms[j]]
+            i += 1
+            j += 1
+
+        merged = old_postings[old_starts[old]:old_starts[old + 1]] if old is not None else array('q')
+        if term in dead_terms:
+            merged = array('q', [p for p in merged if flags[p & DOC_MASK]])
+        if new is not None:
+            merged = _merge_sorted(merged, new)
+        if merged:
+            terms.append(term)
+            postings.extend(merged)
+            starts.append(len(postings))
+    return terms, starts, postings
+
+def _has_garbage(index: Dict[str, Any]) -> bool:
+    """Whether dead documents or dead text outweigh the live ones"""
+    dead_docs = len(index['docFlags']) - index['docCount']
+    text_size = os.path.getsize(os.path.join(DATA_DIR, index['textFile']))
+    return dead_docs > index['docCount'] or text_size > 2 * index['liveTextBytes']
+
+def _compact_index():
+    """
+    Rotate the change feed, merge the delta into a new base and snapshot it.
+    The lock is only held to rotate the feed and to swap the new base in.
+    """
+    with _index_lock:
+        index = _index
+        if _has_garbage(index):
+            # A rebuild renumbers documents and rewrites the text file
+            _maintenance['rebuild'] = True
+            return
+
+    with _feed_lock(), _index_lock:
+        if _feed_inode() != index['feedInode']:
+            _maintenance['rebuild'] = True
+            return
+        # No writer is mid-append while the feed lock is held, so the feed
+        # is complete and can be replaced by an empty one
+        index['feedOffset'] = _read_feed(index, index['feedOffset'])
+        tmp_file = f"{CHAT_CHANGES_FILE}.tmp"
+        open(tmp_file, 'w').close()
+        os.replace(tmp_file, CHAT_CHANGES_FILE)
+        index['feedInode'], index['feedOffset'] = _feed_inode(), 0
+
+        cut = len(index['docFlags'])
+        index['frozen'], index['delta'] = index['delta'], {}
+        index['frozenDead'], index['dead'] = index['dead'], {}
+        index['deltaStart'] = cut
+        snapshot = {field: index[field] for field in SNAPSHOT_FIELDS}
+        snapshot['chatIds'] = list(index['chatIds'])
+        for name in DOC_ARRAYS:
+            snapshot[name] = index[name][:cut]
+        index['text'].flush()
+
+    terms, starts, postings = _merge_postings(
+        index, index['frozen'], set(index['frozenDead']), snapshot['docFlags']
+    )
+    with _index_lock:
+        index.update(terms=terms, termStarts=starts, postings=postings, baseEnd=cut,
+                     frozen=None, frozenDead={})
+
+    snapshot.update(terms=terms, termStarts=starts, postings=postings)
+    snapshot['chatStarts'], snapshot['chatDocList'] = _group_chats(
+        len(snapshot['chatIds']), snapshot['docChat'], snapshot['docFlags']
+    )
+    _write_snapshot(snapshot)
+
+def _needs_compaction(index: Dict[str, Any]) -> bool:
+    return index['frozen'] is None and (
+        len(index['docFlags']) - index['deltaStart'] >= COMPACT_DELTA_DOCS
+        or index['feedOffset'] >= COMPACT_FEED_BYTES
+    )
+
+def _maintain():
+    """Run pending rebuilds and compactions until there are none"""
+    while True:
+        with _index_lock:
+            if _maintenance['rebuild']:
+                task = _rebuild_index
+            elif _index is not None and _needs_compaction(_index):
+                task = _compact_index
+            else:
+                _maintenance['thread'] = None
+                return
+        try:
+            task()
+        except Exception as e:
+            print(f"Error maintaining search index: {e}")
+            with _index_lock:
+                _maintenance['retryAt'] = time.monotonic() + MAINTENANCE_RETRY_SECONDS
+                _maintenance['thread'] = None
+            return
+
+def _schedule_maintenance(rebuild: bool = False):
+    """Start the maintenance thread if it isn't running; call with _index_lock held"""
+    if rebuild:
+        _maintenance['rebuild'] = True
+    if _maintenance['thread'] is None and time.monotonic() >= _maintenance['retryAt']:
+        _maintenance['thread'] = threading.Thread(target=_maintain, daemon=True)
+        _maintenance['thread'].start()
+
+def _ensure_index() -> Dict[str, Any]:
+    """Get the index with new feed entries applied; call with _index_lock held"""
+    if _index is None and (_maintenance['rebuild'] or not _load_index()):
+        _schedule_maintenance(rebuild=True)
+        raise SearchIndexBuilding("Search index is being built")
+
+    index = _index
+    if _maintenance['rebuild']:
+        # Serve the current index until the rebuild replaces it
+        _schedule_maintenance()
+        return index
+
+    try:
+        feed_size = os.path.getsize(CHAT_CHANGES_FILE)
+    except OSError:
+        feed_size = -1
+    if _feed_inode() != index['feedInode'] or feed_size < index['feedOffset']:
+        # The feed was replaced or truncated behind our back, so the offset
+        # means nothing now; rebuild from chats.json
+        _schedule_maintenance(rebuild=True)
+        return index
+
+    index['feedOffset'] = _read_feed(index, index['feedOffset'])
+    if _needs_compaction(index):
+        _schedule_maintenance()
+    return index
+
+def start_search_index():
+    """Load the search index, or start building it, on a background thread"""
+    def load():
+        try:
+            with _index_lock:
+                _ensure_index()
+        except SearchIndexBuilding:
+            pass
+        except Exception as e:
+            print(f"Error loading search index: {e}")
+
+    threading.Thread(target=load, daemon=True).start()
+
+def _term_postings(index: Dict[str, Any], term: str) -> List[Tuple[int, array, int, int]]:
+    """Get a term's postings as (layer, postings, start, end), one per layer"""
+    ranges = []
+    terms = index['terms']
+    i = bisect_left(terms, term)
+    if i < len(terms) and terms[i] == term:
+        ranges.append((LAYER_BASE, index['postings'], index['termStarts'][i], index['termStarts'][i + 1]))
+    if index['frozen'] is not None and term in index['frozen']:
+        ranges.append((LAYER_FROZEN, index['frozen'][term], 0, len(index['frozen'][term])))
+    if term in index['delta']:
+        ranges.append((LAYER_DELTA, index['delta'][term], 0, len(index['delta'][term])))
+    return ranges
+
+def _cursor_bound(cursor: List[Any]) -> float:
+    """The most any posting left in the cursor can add to a score"""
+    if cursor[CURSOR_POS] >= cursor[CURSOR_END]:
+        return 0.0
+    posting = cursor[CURSOR_POSTINGS][cursor[CURSOR_POS]]
+    return cursor[CURSOR_UNIT] * (IMPACT_LEVELS - (posting >> DOC_BITS))
+
+def _score_doc(index: Dict[str, Any], doc: int, terms: List[str], units: Dict[int, float]) -> float:
+    """Score a document from its text, for terms whose postings haven't reached it"""
+    counts, length = _term_counts(_read_doc(index, doc)[1])
+    flag = index['docFlags'][doc]
+    score = 0.0
+    for bit_no, term in enumerate(terms):
+        if counts.get(term) and (1 << bit_no) in units:
+            score += units[1 << bit_no] * _impact(index, counts[term], length, flag)
+    return score
+
+def _settle(index: Dict[str, Any], cursors: List[List[Any]], terms: List[str], units: Dict[int, float],
+            scores: Dict[int, float], masks: Dict[int, int], resolved: set, k: int) -> bool:
+    """
+    Check whether the top k can still change. Documents the check is
+    unsure about are scored from their text when there are few of them.
+    """
+    open_bounds: Dict[int, List[Tuple[int, float]]] = {}
+    for cursor in cursors:
+        if cursor[CURSOR_POS] < cursor[CURSOR_END]:
+            open_bounds.setdefault(cursor[CURSOR_LAYER], []).append((cursor[CURSOR_BIT], _cursor_bound(cursor)))
+    # No document can gain more than the open cursors of its layer combined
+    unseen = max((sum(bound for _, bound in bounds) for bounds in open_bounds.values()), default=0.0)
+    if unseen == 0.0:
+        return True
+
+    def remaining(doc: int) -> float:
+        mask = masks[doc]
+        return sum(bound for bit, bound in open_bounds.get(_doc_layer(index, doc), ()) if not mask & bit)
+
+    top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+    if unseen > top[-1][1]:
+        return False
+
+    # Complete the top documents first; that can only raise the cut-off
+    for doc, _ in top:
+        if doc not in resolved and remaining(doc) > 0:
+            scores[doc] = _score_doc(index, doc, terms, units)
+            resolved.add(doc)
+    top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+    kth = top[-1][1]
+    top_docs = {doc for doc, _ in top}
+
+    postings_left = sum(cursor[CURSOR_END] - cursor[CURSOR_POS] for cursor in cursors)
+    limit = max(SEARCH_RESOLVE_LIMIT, postings_left // SEARCH_RESOLVE_RATIO)
+    unsure = []
+    for doc, score in scores.items():
+        if score + unseen <= kth or doc in top_docs or doc in resolved:
+            continue
+        if score + remaining(doc) > kth:
+            unsure.append(doc)
+            if len(unsure) > limit:
+                return False
+    for doc in unsure:
+        scores[doc] = _score_doc(index, doc, terms, units)
+        resolved.add(doc)
+    return True
+
+def _top_docs(index: Dict[str, Any], terms: List[str], k: int) -> Tuple[List[Tuple[int, float]], int, bool]:
+    """
+    Find the k best-scoring documents for the terms, best first.
+
+    Each term has a cursor per layer that walks its postings in impact
+    order, a block at a time, always advancing the cursor that can add the
+    most. Every so often the scores are checked, and once no unread posting
+    can change the top k the rest are skipped.
+
+    Returns (hits as (doc, score), total matches, whether the total is exact).
+    """
+    flags = index['docFlags']
+    doc_count = max(index['docCount'], 1)
+    cursors: List[List[Any]] = []
+    units: Dict[int, float] = {}
+    dfs = []
+    for bit_no, term in enumerate(terms):
+        ranges = _term_postings(index, term)
+        df = (sum(end - start for _, _, start, end in ranges)
+              - index['dead'].get(term, 0) - index['frozenDead'].get(term, 0))
+        if df <= 0:
+            continue
+        dfs.append(df)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        units[1 << bit_no] = idf * MAX_WEIGHT / IMPACT_LEVELS
+        for layer, postings, start, end in ranges:
+            cursors.append([start, end, postings, units[1 << bit_no], 1 << bit_no, layer])
+
+    scores: Dict[int, float] = {}
+    masks: Dict[int, int] = {}
+    resolved: set = set()
+    steps, next_check = 0, 1
+    while True:
+        cursor = max(cursors, key=_cursor_bound, default=None)
+        if cursor is None or cursor[CURSOR_POS] >= cursor[CURSOR_END]:
+            break
+        pos, end, postings, unit, bit = cursor[:CURSOR_LAYER]
+        stop = min(pos + SEARCH_BLOCK, end)
+        for posting in postings[pos:stop]:
+            doc = posting & DOC_MASK
+            if flags[doc] and doc not in resolved:
+                scores[doc] = scores.get(doc, 0.0) + unit * (IMPACT_LEVELS - (posting >> DOC_BITS))
+                masks[doc] = masks.get(doc, 0) | bit
+        cursor[CURSOR_POS] = stop
+
+        steps += 1
+        if steps == next_check:
+            next_check *= 2
+            if len(scores) >= k and _settle(index, cursors, terms, units, scores, masks, resolved, k):
+                break
+
+    exhausted = all(cursor[CURSOR_POS] >= cursor[CURSOR_END] for cursor in cursors)
+    top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+    if not exhausted:
+        # A document missing a term's bit may still contain it further down
+        every_bit = sum(units)
+        top = [(doc, score if doc in resolved or masks[doc] == every_bit
+                else _score_doc(index, doc, terms, units)) for doc, score in top]
+    top.sort(key=lambda hit: (-hit[1], hit[0]))
+
+    if exhausted:
+        return top, len(scores), True
+    if len(dfs) == 1:
+        return top, dfs[0], True
+    # Several terms with the postings only partly read: estimate the union
+    missing = 1.0
+    for df in dfs:
+        missing *= 1 - min(df, doc_count) / doc_count
+    total = min(max(round(doc_count * (1 - missing)), len(scores), max(dfs)), sum(dfs))
+    return top, total, False
+
+def _make_snippet(text: str, terms: List[str]) -> str:
+    """Cut a window of text around the first query term and bold the matches"""
+    positions = [m.start() for m in (re.search(r"\b" + re.escape(t), text, re.IGNORECASE) for t in terms) if m]
+    start = max(min(positions) - SNIPPET_RADIUS, 0) if positions else 0
+    end = min(start + 2 * SNIPPET_RADIUS, len(text))
+
+    snippet = text[start:end]
+    for term in terms:
+        snippet = re.sub(rf"\b({re.escape(term)})", r"**\1**", snippet, flags=re.IGNORECASE)
+
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if end < len(text) else ""
+    return f"{prefix}{snippet}{suffix}"
+
+def search_chats(query: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+    """
+    Search chat names and messages, ranked by BM25.
+
+    Returns one page of hits with snippets plus the number of matches, which
+    is estimated for multi-term queries that stopped early.
+    Raises SearchIndexBuilding until the first build has finished.
+    """
+    terms = list(dict.fromkeys(_tokenize(query)))
+    page = max(page, 1)
+    page_size = max(page_size, 1)
+
+    with _index_lock:
+        index = _ensure_index()
+        hits, total, exact = _top_docs(index, terms, page * page_size)
+
+        results = []
+        for doc, score in hits[(page - 1) * page_size:]:
+            chat_no = index['docChat'][doc]
+            message_id, text = _read_doc(index, doc)
+            name_doc = next((d for d in _chat_docs(index, chat_no, keep=False)
+                             if index['docFlags'][d] == DOC_NAME), None)
+            results.append({
+                'chatId': index['chatIds'][chat_no],
+                'chatName': _read_doc(index, name_doc)[1] if name_doc is not None else '',
+                'messageId': message_id,
+                'field': 'name' if index['docFlags'][doc] == DOC_NAME else 'message',
+                'score': round(score, 4),
+                'snippet': _make_snippet(text, terms)
+            })
+
+    return {
+        'query': query,
+        'total': total,
+        'totalIsEstimate': not exact,
+        'page': page,
+        'pageSize': page_size,
+        'results': results
+    }
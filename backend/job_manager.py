@@ -0,0 +1,258 @@
+import json
+import os
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+
+import ollama_service
+import response_store
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+JOBS_FILE = os.path.join(DATA_DIR, 'jobs.json')
+JOB_OUTPUT_DIR = os.path.join(DATA_DIR, 'job-output')
+
+# Generations run concurrently; Ollama queues anything beyond its own limit
+MAX_WORKERS = 2
+
+# Streamed output is flushed to the job's output file at most this often (seconds)
+SAVE_INTERVAL = 1.0
+
+# Completed and failed jobs are removed this long after they finish (seconds)
+JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# Route task used for each job kind, for the progress estimate
+JOB_TASKS = {
+    "course": "course_structure",
+    "lesson": "lesson_content",
+}
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed")
+
+_lock = threading.RLock()
+_jobs: Optional[Dict[str, Dict[str, Any]]] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Output of jobs running in this process; other jobs' output is on disk
+_partial: Dict[str, List[str]] = {}
+
+def load_jobs() -> Dict[str, Dict[str, Any]]:
+    """Load all jobs from JSON file"""
+    try:
+        with open(JOBS_FILE, 'r') as f:
+            jobs = {job['id']: job for job in json.load(f)}
+        # Stores written before output moved to JOB_OUTPUT_DIR kept it inline
+        for job in jobs.values():
+            job.pop('partialOutput', None)
+        return jobs
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_jobs() -> bool:
+    """Save all jobs to JSON file"""
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+
+        # Write to a temp file first so a crash never leaves a partial store
+        tmp_file = f"{JOBS_FILE}.tmp"
+        with _lock:
+            with open(tmp_file, 'w') as f:
+                json.dump(list(_get_jobs().values()), f, ensure_ascii=False)
+            os.replace(tmp_file, JOBS_FILE)
+        return True
+    except Exception as e:
+        print(f"Error saving jobs: {e}")
+        return False
+
+def _get_jobs() -> Dict[str, Dict[str, Any]]:
+    global _jobs
+    if _jobs is None:
+        _jobs = load_jobs()
+    return _jobs
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job-worker")
+    return _executor
+
+def make_job_key(kind: str, params: Dict[str, Any]) -> str:
+    """Identify identical submissions by kind and parameters"""
+    payload = json.dumps([kind, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _output_path(job_id: str) -> str:
+    return os.path.join(JOB_OUTPUT_DIR, f"{job_id}.txt")
+
+def _read_output(job_id: str) -> str:
+    """Get the output a job has streamed so far"""
+    if job_id in _partial:
+        return "".join(_partial[job_id])
+    try:
+        with open(_output_path(job_id), 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+def _remove_output(job_id: str):
+    try:
+        os.remove(_output_path(job_id))
+    except FileNotFoundError:
+        pass
+
+def _update_job(job_id: str, persist: bool = True, **fields: Any):
+    """Update a job's fields; progress updates pass persist=False and stay in memory"""
+    with _lock:
+        job = _get_jobs()[job_id]
+        job.update(fields)
+        job['updatedAt'] = datetime.now().isoformat()
+    if persist:
+        save_jobs()
+
+def _expire_jobs() -> int:
+    """Remove finished jobs older than JOB_RETENTION_SECONDS"""
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with _lock:
+        jobs = _get_jobs()
+        expired = [
+            job_id for job_id, job in jobs.items()
+            if job['status'] in FINISHED_STATUSES
+            and datetime.fromisoformat(job.get('finishedAt') or job['updatedAt']).timestamp() < cutoff
+        ]
+        for job_id in expired:
+            del jobs[job_id]
+            _remove_output(job_id)
+        if expired:
+            save_jobs()
+    return len(expired)
+
+def _run_job(job_id: str):
+    """Run a job on a worker thread, streaming its output to a file"""
+    with _lock:
+        job = dict(_get_jobs()[job_id])
+    kind, params = job['kind'], job['params']
+
+    _, options = ollama_service.resolve_route(JOB_TASKS[kind])
+    expected_chunks = options.get('num_predict') or 512
+    partial: List[str] = []
+    output = {"file": None, "flushed": time.monotonic()}
+
+    def on_chunk(chunk: str):
+        # Output from before a restart is kept until the new run produces its own
+        if output["file"] is None:
+            os.makedirs(JOB_OUTPUT_DIR, exist_ok=True)
+            output["file"] = open(_output_path(job_id), 'w', encoding='utf-8')
+            with _lock:
+                _partial[job_id] = partial
+        partial.append(chunk)
+        output["file"].write(chunk)
+        if time.monotonic() - output["flushed"] >= SAVE_INTERVAL:
+            output["file"].flush()
+            output["flushed"] = time.monotonic()
+        _update_job(
+            job_id, persist=False,
+            progress=round(min(len(partial) / expected_chunks, 0.99), 2)
+        )
+
+    _update_job(job_id, status='running', progress=0.0, startedAt=datetime.now().isoformat())
+    try:
+        if kind == "course":
+            result = ollama_service.generate_course_structure(
+                params['topic'], params['subject'], params['difficulty'],
+                params['lessons_count'], on_chunk=on_chunk, raise_on_error=True
+            )
+        else:
+            result = response_store.get_response("lesson_content", **params)
+            if result is None:
+                result = ollama_service.generate_lesson_content(
+                    params['lesson_title'], params['course_topic'], params['subject'],
+                    params['difficulty'], params['lesson_number'], on_chunk=on_chunk
+                )
+                # Connection errors can arrive after part of the lesson
+                if ollama_service.is_error_response(result, partial[-1] if partial else None):
+                    raise RuntimeError(partial[-1] if partial else result)
+
+        with _lock:
+            _partial.pop(job_id, None)
+        _remove_output(job_id)
+        _update_job(job_id, status='completed', result=result, progress=1.0,
+                    finishedAt=datetime.now().isoformat())
+    except Exception as e:
+        # Partial output stays on disk so the failure can be inspected
+        with _lock:
+            _partial.pop(job_id, None)
+        _update_job(job_id, status='failed', error=str(e), finishedAt=datetime.now().isoformat())
+    finally:
+        if output["file"] is not None:
+            output["file"].close()
+
+def submit_job(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue a generation job and return it. An identical submission returns
+    the existing job instead; a failed one is re-queued under the same id.
+    """
+    if kind not in JOB_TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    _expire_jobs()
+    key = make_job_key(kind, params)
+    with _lock:
+        jobs = _get_jobs()
+        job = next((j for j in jobs.values() if j.get('key') == key), None)
+
+        if job is not None and job['status'] != 'failed':
+            return get_job(job['id'])
+
+        now = datetime.now().isoformat()
+        if job is None:
+            job = {
+                'id': str(uuid.uuid4()),
+                'key': key,
+                'kind': kind,
+                'params': params,
+                'createdAt': now
+            }
+            jobs[job['id']] = job
+
+        job.update({
+            'status': 'queued',
+            'progress': 0.0,
+            'result': None,
+            'error': None,
+            'finishedAt': None,
+            'updatedAt': now
+        })
+        _remove_output(job['id'])
+        save_jobs()
+        _get_executor().submit(_run_job, job['id'])
+        return get_job(job['id'])
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get a specific job by ID, with its output so far until it completes"""
+    with _lock:
+        job = _get_jobs().get(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        if job['status'] != 'completed':
+            job['partialOutput'] = _read_output(job_id)
+        return job
+
+def resume_jobs() -> int:
+    """Re-queue jobs left queued or running when the server last stopped"""
+    _expire_jobs()
+    with _lock:
+        pending = [job for job in _get_jobs().values() if job['status'] in ACTIVE_STATUSES]
+        for job in pending:
+            job['status'] = 'queued'
+            job['updatedAt'] = datetime.now().isoformat()
+        if pending:
+            save_jobs()
+        for job in pending:
+            _get_executor().submit(_run_job, job['id'])
+    return len(pending)
@@ -1,11 +1,127 @@
+import os
 import time
 import json
 import requests
-from typing import Generator, Dict, Any, Optional
+from typing import Generator, Dict, Any, Optional, Tuple, Callable
+
+import tracing
 
 MODEL = "gemma3n"
+SMALL_MODEL = "gemma3:1b"
 OLLAMA_BASE_URL = "http://localhost:11434"
 
+# Optional JSON file overriding the routing table below
+ROUTES_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'data', 'model-routes.json')
+
+# How long (seconds) the /api/tags model list is reused when resolving routes
+MODELS_CACHE_TTL = 60
+
+DEFAULT_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "top_k": 40,
+    "repeat_penalty": 1.1,
+    "num_predict": 512,  # Limit for conciseness
+}
+
+# Each task maps to a list of candidate models (first available wins) and
+# the generation options layered on top of DEFAULT_OPTIONS. Short tasks go
+# to the small model so the large one stays free for chat and generation.
+MODEL_ROUTES = {
+    "chat": {
+        "models": [MODEL],
+        "options": {},
+    },
+    "flashcard_explanation": {
+        "models": [SMALL_MODEL, MODEL],
+        "options": {"temperature": 0.5, "num_predict": 384},
+    },
+    "study_hints": {
+        "models": [SMALL_MODEL, MODEL],
+        "options": {"temperature": 0.6, "num_predict": 384},
+    },
+    "concept_explanation": {
+        "models": [SMALL_MODEL, MODEL],
+        "options": {"temperature": 0.5, "num_predict": 256},
+    },
+    "practice": {
+        "models": [MODEL],
+        "options": {"num_predict": 1024},
+    },
+    "course_structure": {
+        "models": [MODEL],
+        "options": {"temperature": 0.4, "num_predict": 1024},
+    },
+    "lesson_content": {
+        "models": [MODEL],
+        "options": {"num_predict": 2048},
+    },
+    "smoke_test": {
+        "models": [SMALL_MODEL, MODEL],
+        "options": {"temperature": 0.0, "num_predict": 16},
+    },
+}
+
+_models_cache = {"models": [], "fetched_at": None}
+_routes_cache = {"mtime": None, "routes": None}
+
+def _parse_keep_alive(value: str):
+    """Ollama takes keep_alive as seconds (negative = forever) or a duration like 30m"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+# How long Ollama keeps a model resident after a request; -1 pins it
+KEEP_ALIVE = _parse_keep_alive(os.environ.get('STEM_OLLAMA_KEEP_ALIVE', '-1'))
+
+# Module-level so every request (and the warm-up) sends byte-identical
+# system text, letting Ollama reuse the cached prompt prefix.
+SYSTEM_PROMPT = {
+    "role": "system",
+    "content": (
+        "You are an expert STEM tutor specializing in Mathematics, Physics, Chemistry, Biology, Computer Science, and Engineering. "
+        "Your teaching style is concise, clear, and encouraging.\n\n"
+
+        "**CORE PRINCIPLES:**\n"
+        "- Be concise but thorough - aim for 2-4 sentences per response unless more detail is requested\n"
+        "- Use clear, simple language appropriate for the student's level\n"
+        "- Break down complex concepts into digestible steps\n"
+        "- Provide practical examples and real-world applications\n"
+        "- Encourage critical thinking with follow-up questions\n"
+        "- Be patient, supportive, and encouraging\n\n"
+
+        "**FORMATTING RULES:**\n"
+        "1. Use proper markdown formatting for better readability\n"
+        "2. Use **bold** for emphasis and important points\n"
+        "3. Use `code` for code snippets, variables, and technical terms\n"
+        "4. Use ```code blocks``` for multi-line code examples\n"
+        "5. Use bullet points (• or -) for lists\n"
+        "6. Use numbered lists for step-by-step instructions\n"
+        "7. Add proper spacing between sections\n"
+        "8. Use headers (##) to organize content when appropriate\n\n"
+
+        "**RESPONSE RULES:**\n"
+        "1. Start with a brief, direct answer\n"
+        "2. Follow with a concise explanation\n"
+        "3. End with a relevant example or follow-up question when appropriate\n"
+        "4. Use bullet points or numbered lists for multi-step processes\n"
+        "5. Include relevant formulas or code snippets when needed\n"
+        "6. Keep responses focused and actionable\n"
+        "7. If a topic requires extensive explanation, break it into smaller parts\n\n"
+
+        "**SUBJECTS EXPERTISE:**\n"
+        "- Mathematics: Algebra, Calculus, Statistics, Geometry, Discrete Math\n"
+        "- Physics: Mechanics, Thermodynamics, Electromagnetism, Quantum Physics\n"
+        "- Chemistry: Organic, Inorganic, Physical Chemistry, Biochemistry\n"
+        "- Biology: Cell Biology, Genetics, Ecology, Human Biology\n"
+        "- Computer Science: Programming, Algorithms, Data Structures, Software Engineering\n"
+        "- Engineering: Mechanical, Electrical, Civil, Chemical Engineering\n\n"
+
+        "Keep responses educational, encouraging, and appropriately detailed for the context."
+    )
+}
+
 def check_ollama_connection() -> bool:
     """Check if Ollama service is running"""
     try:
@@ -26,57 +142,138 @@ def pull_model(model: str = MODEL) -> bool:
         print(f"Error pulling model: {e}")
         return False
 
-def ask_gemma_tutor(prompt: str, conversation_history: list = None) -> Generator[str, None, None]:
+def _valid_override(task: str, override: Any) -> bool:
+    """Check a routes config entry, warning about anything malformed"""
+    if not isinstance(override, dict):
+        print(f"⚠️  Ignoring model route {task!r}: expected an object")
+        return False
+    models = override.get('models')
+    if models is not None and (not isinstance(models, list)
+                               or not all(isinstance(m, str) and m for m in models)):
+        print(f"⚠️  Ignoring model route {task!r}: 'models' must be a list of model names")
+        return False
+    options = override.get('options')
+    if options is not None and not isinstance(options, dict):
+        print(f"⚠️  Ignoring model route {task!r}: 'options' must be an object")
+        return False
+    return True
+
+def load_model_routes() -> Dict[str, Dict[str, Any]]:
     """
-    Specialized function for AI tutor with streaming responses
+    Build the routing table, applying overrides from ROUTES_CONFIG_FILE.
+
+    The config file maps task names to {"models": [...], "options": {...}};
+    options are merged over the built-in route, models replace it. The
+    result is cached until the file changes; malformed entries are skipped.
     """
-    system_prompt = {
-        "role": "system",
-        "content": (
-            "You are an expert STEM tutor specializing in Mathematics, Physics, Chemistry, Biology, Computer Science, and Engineering. "
-            "Your teaching style is concise, clear, and encouraging.\n\n"
-            
-            "**CORE PRINCIPLES:**\n"
-            "- Be concise but thorough - aim for 2-4 sentences per response unless more detail is requested\n"
-            "- Use clear, simple language appropriate for the student's level\n"
-            "- Break down complex concepts into digestible steps\n"
-            "- Provide practical examples and real-world applications\n"
-            "- Encourage critical thinking with follow-up questions\n"
-            "- Be patient, supportive, and encouraging\n\n"
-            
-            "**FORMATTING RULES:**\n"
-            "1. Use proper markdown formatting for better readability\n"
-            "2. Use **bold** for emphasis and important points\n"
-            "3. Use `code` for code snippets, variables, and technical terms\n"
-            "4. Use ```code blocks``` for multi-line code examples\n"
-            "5. Use bullet points (• or -) for lists\n"
-            "6. Use numbered lists for step-by-step instructions\n"
-            "7. Add proper spacing between sections\n"
-            "8. Use headers (##) to organize content when appropriate\n\n"
-            
-            "**RESPONSE RULES:**\n"
-            "1. Start with a brief, direct answer\n"
-            "2. Follow with a concise explanation\n"
-            "3. End with a relevant example or follow-up question when appropriate\n"
-            "4. Use bullet points or numbered lists for multi-step processes\n"
-            "5. Include relevant formulas or code snippets when needed\n"
-            "6. Keep responses focused and actionable\n"
-            "7. If a topic requires extensive explanation, break it into smaller parts\n\n"
-            
-            "**SUBJECTS EXPERTISE:**\n"
-            "- Mathematics: Algebra, Calculus, Statistics, Geometry, Discrete Math\n"
-            "- Physics: Mechanics, Thermodynamics, Electromagnetism, Quantum Physics\n"
-            "- Chemistry: Organic, Inorganic, Physical Chemistry, Biochemistry\n"
-            "- Biology: Cell Biology, Genetics, Ecology, Human Biology\n"
-            "- Computer Science: Programming, Algorithms, Data Structures, Software Engineering\n"
-            "- Engineering: Mechanical, Electrical, Civil, Chemical Engineering\n\n"
-            
-            "Keep responses educational, encouraging, and appropriately detailed for the context."
-        )
+    try:
+        mtime = os.stat(ROUTES_CONFIG_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if _routes_cache["routes"] is not None and _routes_cache["mtime"] == mtime:
+        return _routes_cache["routes"]
+
+    routes = {
+        task: {"models": list(route["models"]), "options": dict(route["options"])}
+        for task, route in MODEL_ROUTES.items()
     }
-    
+
+    overrides = {}
+    if mtime is not None:
+        try:
+            with open(ROUTES_CONFIG_FILE, 'r') as f:
+                overrides = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading model routes: {e}")
+        if not isinstance(overrides, dict):
+            print("⚠️  Ignoring model routes config: expected an object of routes")
+            overrides = {}
+
+    for task, override in overrides.items():
+        if not _valid_override(task, override):
+            continue
+        route = routes.setdefault(task, {"models": [MODEL], "options": {}})
+        if override.get('models'):
+            route['models'] = list(override['models'])
+        route['options'].update(override.get('options') or {})
+
+    _routes_cache["mtime"] = mtime
+    _routes_cache["routes"] = routes
+    return routes
+
+def _cached_available_models() -> list:
+    """Return the /api/tags model list, refreshed at most every MODELS_CACHE_TTL seconds"""
+    # An empty list is cached too, so a stopped Ollama costs one request per TTL
+    now = time.time()
+    if _models_cache["fetched_at"] is None or now - _models_cache["fetched_at"] > MODELS_CACHE_TTL:
+        _models_cache["models"] = get_available_models()
+        _models_cache["fetched_at"] = now
+    return _models_cache["models"]
+
+def resolve_route(task: str = "chat") -> Tuple[str, Dict[str, Any]]:
+    """
+    Pick the model and generation options for a task.
+
+    Falls back to the next candidate when a model is missing from the
+    tags list, and to MODEL when none of the candidates are installed.
+    """
+    routes = load_model_routes()
+    route = routes.get(task, routes["chat"])
+
+    available = _cached_available_models()
+    model = MODEL
+    for candidate in route["models"]:
+        if any(candidate in name for name in available):
+            model = candidate
+            break
+
+    options = dict(DEFAULT_OPTIONS)
+    options.update(route["options"])
+    return model, options
+
+def is_model_loaded(model: str = MODEL) -> bool:
+    """
+    Check if a model is currently resident in Ollama's memory
+    """
+    try:
+        response = requests.get(f"{OLLAMA_BASE_URL}/api/ps", timeout=5)
+        if response.status_code == 200:
+            models = response.json().get('models', [])
+            return any(model in m.get('name', '') for m in models)
+        return False
+    except requests.exceptions.RequestException:
+        return False
+
+def warm_up_model(model: str = MODEL) -> bool:
+    """
+    Load a model into memory with a one-token generation and pin it with
+    KEEP_ALIVE, so the first student request doesn't pay the load time.
+    """
+    try:
+        response = requests.post(
+            f"{OLLAMA_BASE_URL}/api/chat",
+            json={
+                "model": model,
+                "messages": [dict(SYSTEM_PROMPT), {"role": "user", "content": "Hi"}],
+                "stream": False,
+                "options": {"num_predict": 1},
+                "keep_alive": KEEP_ALIVE
+            },
+            timeout=300
+        )
+        return response.status_code == 200
+    except requests.exceptions.RequestException as e:
+        print(f"Error warming up model {model}: {e}")
+        return False
+
+def ask_gemma_tutor(prompt: str, conversation_history: list = None, task: str = "chat") -> Generator[str, None, None]:
+    """
+    Specialized function for AI tutor with streaming responses.
+    The model and generation options come from the route for `task`.
+    """
     # Build message history
-    messages = [system_prompt]
+    messages = [dict(SYSTEM_PROMPT)]
     
     # Add conversation history if provided
     if conversation_history:
@@ -85,32 +282,37 @@ def ask_gemma_tutor(prompt: str, conversation_history: list = None) -> Generator
     # Add current user message
     messages.append({"role": "user", "content": prompt})
     
+    model, options = resolve_route(task)
+    
     try:
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={
-                "model": MODEL,
-                "messages": messages,
-                "stream": True,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "repeat_penalty": 1.1,
-                    "num_predict": 512,  # Limit for conciseness
-                }
-            },
-            stream=True
-        )
+        request_start = time.perf_counter()
+        with tracing.span("ollama.request", model=model, task=task):
+            response = requests.post(
+                f"{OLLAMA_BASE_URL}/api/chat",
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "stream": True,
+                    "options": options,
+                    "keep_alive": KEEP_ALIVE
+                },
+                stream=True
+            )
         
         if response.status_code != 200:
             yield f"Error: Ollama API returned status {response.status_code}"
             return
             
+        first_line = True
         for line in response.iter_lines():
+            if first_line:
+                tracing.record_span("ollama.first_byte", request_start, time.perf_counter(), model=model)
+                first_line = False
             if line:
                 try:
+                    parse_start = time.perf_counter()
                     data = json.loads(line.decode('utf-8'))
+                    tracing.add_time("ollama.parse", time.perf_counter() - parse_start)
                     if 'message' in data and 'content' in data['message']:
                         content = data['message']['content']
                         if content:
@@ -127,19 +329,33 @@ def ask_gemma_tutor(prompt: str, conversation_history: list = None) -> Generator
     except Exception as e:
         yield f"Unexpected error: {str(e)}"
 
-def ask_gemma_simple(prompt: str, conversation_history: list = None) -> str:
+# ask_gemma_tutor reports failures as a final chunk starting with one of these
+ERROR_PREFIXES = ("Error", "Unexpected error")
+
+def is_error_response(response: str, last_chunk: Optional[str] = None) -> bool:
+    """Check whether a response, or the last chunk streamed for it, is an Ollama error"""
+    return response.startswith(ERROR_PREFIXES) or bool(last_chunk and last_chunk.startswith(ERROR_PREFIXES))
+
+def ask_gemma_simple(prompt: str, conversation_history: list = None, task: str = "chat",
+                     on_chunk: Optional[Callable[[str], None]] = None) -> str:
     """
-    Non-streaming version for simple responses
+    Non-streaming version for simple responses.
+    `on_chunk`, if given, is called with each chunk as it arrives.
     """
     full_response = ""
     try:
-        for chunk in ask_gemma_tutor(prompt, conversation_history):
+        for chunk in ask_gemma_tutor(prompt, conversation_history, task):
+            concat_start = time.perf_counter()
             full_response += chunk
+            tracing.add_time("simple.concat", time.perf_counter() - concat_start)
+            if on_chunk:
+                on_chunk(chunk)
         return full_response
     except Exception as e:
         return f"Error: {str(e)}"
 
-def generate_flashcard_explanation(question: str, answer: str, subject: str) -> str:
+def generate_flashcard_explanation(question: str, answer: str, subject: str,
+                                   on_chunk: Optional[Callable[[str], None]] = None) -> str:
     """
     Generate a detailed explanation for a flashcard
     """
@@ -159,7 +375,7 @@ def generate_flashcard_explanation(question: str, answer: str, subject: str) ->
     Keep it concise but educational (2-3 paragraphs maximum).
     """
     
-    return ask_gemma_simple(prompt)
+    return ask_gemma_simple(prompt, task="flashcard_explanation", on_chunk=on_chunk)
 
 def generate_study_hints(flashcards: list, subject: str) -> str:
     """
@@ -176,9 +392,10 @@ def generate_study_hints(flashcards: list, subject: str) -> str:
     Focus on effective learning strategies, common connections between topics, and memory techniques.
     """
     
-    return ask_gemma_simple(prompt)
+    return ask_gemma_simple(prompt, task="study_hints")
 
-def explain_concept_simply(concept: str, subject: str, difficulty: str = "beginner") -> str:
+def explain_concept_simply(concept: str, subject: str, difficulty: str = "beginner",
+                           on_chunk: Optional[Callable[[str], None]] = None) -> str:
     """
     Explain a concept in simple terms
     """
@@ -192,7 +409,7 @@ def explain_concept_simply(concept: str, subject: str, difficulty: str = "beginn
     - Keep it under 150 words
     """
     
-    return ask_gemma_simple(prompt)
+    return ask_gemma_simple(prompt, task="concept_explanation", on_chunk=on_chunk)
 
 def generate_practice_problems(topic: str, subject: str, count: int = 3) -> str:
     """
@@ -210,11 +427,14 @@ def generate_practice_problems(topic: str, subject: str, count: int = 3) -> str:
     Format with clear numbering and spacing.
     """
     
-    return ask_gemma_simple(prompt)
+    return ask_gemma_simple(prompt, task="practice")
 
-def generate_course_structure(topic: str, subject: str = "General", difficulty: str = "beginner", lessons_count: int = 4) -> dict:
+def generate_course_structure(topic: str, subject: str = "General", difficulty: str = "beginner", lessons_count: int = 4,
+                              on_chunk: Optional[Callable[[str], None]] = None, raise_on_error: bool = False) -> dict:
     """
-    Generate a complete course structure with lessons
+    Generate a complete course structure with lessons.
+    With `raise_on_error`, an Ollama error or a response without a JSON course
+    raises RuntimeError instead of returning the placeholder course.
     """
     prompt = f"""
     Create a structured {difficulty}-level course on "{topic}" in {subject} with {lessons_count} lessons.
@@ -238,7 +458,16 @@ def generate_course_structure(topic: str, subject: str = "General", difficulty:
     Focus on practical, hands-on learning.
     """
     
-    response = ask_gemma_simple(prompt)
+    chunks = []
+    
+    def collect(chunk: str):
+        chunks.append(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+    
+    response = ask_gemma_simple(prompt, task="course_structure", on_chunk=collect)
+    if raise_on_error and is_error_response(response, chunks[-1] if chunks else None):
+        raise RuntimeError(chunks[-1] if chunks else response)
     
     # Try to extract JSON from response
     try:
@@ -250,6 +479,9 @@ def generate_course_structure(topic: str, subject: str = "General", difficulty:
     except:
         pass
     
+    if raise_on_error:
+        raise RuntimeError("Ollama did not return a JSON course structure")
+    
     # Fallback: return structured data
     return {
         "title": f"{topic} Course",
@@ -266,7 +498,8 @@ def generate_course_structure(topic: str, subject: str = "General", difficulty:
         ]
     }
 
-def generate_lesson_content(lesson_title: str, course_topic: str, subject: str = "General", difficulty: str = "beginner", lesson_number: int = 1) -> str:
+def generate_lesson_content(lesson_title: str, course_topic: str, subject: str = "General", difficulty: str = "beginner", lesson_number: int = 1,
+                            on_chunk: Optional[Callable[[str], None]] = None) -> str:
     """
     Generate detailed content for a specific lesson
     """
@@ -316,7 +549,7 @@ def generate_lesson_content(lesson_title: str, course_topic: str, subject: str =
     Keep each part focused and build progressively.
     """
     
-    return ask_gemma_simple(prompt)
+    return ask_gemma_simple(prompt, task="lesson_content", on_chunk=on_chunk)
 
 def check_model_availability(model: str = MODEL) -> bool:
     """
@@ -336,7 +569,7 @@ def get_available_models() -> list:
     Get list of available models
     """
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags")
+        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json().get('models', [])
             return [m.get('name', '') for m in models]
@@ -367,7 +600,7 @@ def test_ollama_connection():
     # Test a simple query
     try:
         print("Testing simple query...")
-        response = ask_gemma_simple("What is 2+2?")
+        response = ask_gemma_simple("What is 2+2?", task="smoke_test")
         if response and not response.startswith("Error"):
             print("✅ Query test successful")
             print(f"Response: {response[:100]}...")
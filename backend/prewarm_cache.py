@@ -0,0 +1,189 @@
+"""
+Pre-generate explanations and lesson content for the app's existing content.
+
+Walks flashcards.json, courses.json and boss-challenges.json and stores each
+generated response in response_store, which the API serves before calling
+Ollama. Items already in the store with unchanged source text are skipped,
+so an interrupted run can simply be started again.
+
+    python prewarm_cache.py --delay 2 --limit 50
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Generator, List, Optional
+
+import ollama_service
+import response_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+FLASHCARDS_FILE = os.path.join(DATA_DIR, 'flashcards.json')
+COURSES_FILE = os.path.join(DATA_DIR, 'courses.json')
+BOSS_CHALLENGES_FILE = os.path.join(DATA_DIR, 'boss-challenges.json')
+
+KINDS = ["flashcard_explanation", "concept_explanation", "lesson_content"]
+
+# Generated responses are written to the store every this many items
+FLUSH_EVERY = 20
+
+def load_json(path: str) -> List[Dict[str, Any]]:
+    """Load a list of items from a JSON data file"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"⚠️  Could not read {os.path.basename(path)}: {e}")
+        return []
+
+def iter_jobs() -> Generator[Dict[str, Any], None, None]:
+    """
+    Yield one job per response to generate. `params` must match the arguments
+    the API endpoints pass to ollama_service, so the stored keys line up.
+    """
+    for card in load_json(FLASHCARDS_FILE):
+        yield {
+            "kind": "flashcard_explanation",
+            "source": f"flashcard:{card.get('id')}",
+            "params": {
+                "question": card.get('question', ''),
+                "answer": card.get('answer', ''),
+                "subject": card.get('subject') or "General",
+            },
+        }
+
+    for course in load_json(COURSES_FILE):
+        subject = course.get('subject') or "General"
+        difficulty = course.get('difficulty') or "beginner"
+        for number, module in enumerate(course.get('modules', []), start=1):
+            source = f"course:{course.get('id')}:{module.get('id')}"
+            yield {
+                "kind": "concept_explanation",
+                "source": source,
+                "params": {
+                    "concept": module.get('title', ''),
+                    "subject": subject,
+                    "difficulty": difficulty,
+                },
+            }
+            if module.get('type') == 'lesson':
+                yield {
+                    "kind": "lesson_content",
+                    "source": source,
+                    "params": {
+                        "lesson_title": module.get('title', ''),
+                        "course_topic": course.get('title', ''),
+                        "subject": subject,
+                        "difficulty": difficulty,
+                        "lesson_number": number,
+                    },
+                }
+
+    for boss in load_json(BOSS_CHALLENGES_FILE):
+        subject = boss.get('subject') or "General"
+        for phase in boss.get('phases', []):
+            for question in phase.get('questions', []):
+                yield {
+                    "kind": "flashcard_explanation",
+                    "source": f"boss:{boss.get('id')}:{phase.get('id')}:{question.get('id')}",
+                    "params": {
+                        "question": question.get('question', ''),
+                        "answer": str(question.get('correctAnswer', '')),
+                        "subject": subject,
+                    },
+                }
+
+def generate(kind: str, params: Dict[str, Any], on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Run the ollama_service function behind a job kind"""
+    if kind == "flashcard_explanation":
+        return ollama_service.generate_flashcard_explanation(
+            params["question"], params["answer"], params["subject"], on_chunk=on_chunk
+        )
+    if kind == "concept_explanation":
+        return ollama_service.explain_concept_simply(
+            params["concept"], params["subject"], params["difficulty"], on_chunk=on_chunk
+        )
+    if kind == "lesson_content":
+        return ollama_service.generate_lesson_content(
+            params["lesson_title"], params["course_topic"], params["subject"],
+            params["difficulty"], params["lesson_number"], on_chunk=on_chunk
+        )
+    raise ValueError(f"Unknown kind: {kind}")
+
+def run(kinds: List[str], limit: int = 0, delay: float = 1.0, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Generate every missing response, pausing `delay` seconds between calls.
+    Stored responses for content that no longer exists are dropped.
+    """
+    stats = {"generated": 0, "skipped": 0, "failed": 0, "pending": 0, "pruned": 0}
+    seen = set()
+
+    try:
+        for job in iter_jobs():
+            kind, params = job["kind"], job["params"]
+            if kind not in kinds:
+                continue
+            seen.add((job["source"], kind))
+
+            if response_store.has_response(kind, **params):
+                stats["skipped"] += 1
+                continue
+
+            if limit and stats["generated"] + stats["failed"] >= limit:
+                stats["pending"] += 1
+                continue
+
+            if dry_run:
+                print(f"Would generate {kind} for {job['source']}")
+                stats["pending"] += 1
+                continue
+
+            print(f"Generating {kind} for {job['source']}...")
+            chunks: List[str] = []
+            response = generate(kind, params, on_chunk=chunks.append)
+            # Errors can also arrive as the last chunk after part of an answer
+            last_chunk = chunks[-1] if chunks else None
+            if not response or ollama_service.is_error_response(response, last_chunk):
+                print(f"❌ Failed: {(last_chunk or response)[:100]}")
+                stats["failed"] += 1
+            else:
+                model, _ = ollama_service.resolve_route(kind)
+                response_store.put_response(kind, job["source"], response, model, **params)
+                stats["generated"] += 1
+                if stats["generated"] % FLUSH_EVERY == 0:
+                    response_store.flush()
+
+            time.sleep(delay)
+
+        if not dry_run:
+            stats["pruned"] = response_store.prune_sources(kinds, seen)
+    finally:
+        # Keep whatever was generated, even if the run is interrupted
+        if not dry_run:
+            response_store.flush()
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate cached responses for existing content")
+    parser.add_argument("--kind", action="append", choices=KINDS,
+                        help="Only generate this kind (repeatable, default: all)")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="Stop after this many generations (0 = no limit)")
+    parser.add_argument("--delay", type=float, default=1.0,
+                        help="Seconds to wait between generations")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List what would be generated without calling Ollama")
+    args = parser.parse_args()
+
+    if not args.dry_run and not ollama_service.check_ollama_connection():
+        print("❌ Ollama is not connected")
+        print("Please make sure Ollama is running: ollama serve")
+        raise SystemExit(1)
+
+    stats = run(args.kind or KINDS, args.limit, args.delay, args.dry_run)
+    print(f"\nGenerated: {stats['generated']}, skipped: {stats['skipped']}, "
+          f"failed: {stats['failed']}, pending: {stats['pending']}, pruned: {stats['pruned']}")
+
+if __name__ == "__main__":
+    main()
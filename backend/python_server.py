@@ -1,15 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import json
+import hmac
+import time
+import asyncio
 import uuid
+import threading
 from datetime import datetime
 import ollama_service
 import chat_manager
+import response_store
+import job_manager
+import tracing
+from tracing_middleware import TracedRoute, TracingMiddleware
 
 app = FastAPI(title="STEM Forge Python Backend", version="1.0.0")
+app.router.route_class = TracedRoute
+
+# Per-request trace spans, returned as X-Trace-Id
+app.add_middleware(TracingMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,8 +31,108 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# Warm-up retry backoff and how often a ready model is checked (seconds)
+WARMUP_RETRY_MIN = 2
+WARMUP_RETRY_MAX = 60
+READINESS_CHECK_INTERVAL = 30
+
+# Background warm-up state, reported by the readiness endpoint
+startup_state = {
+    "ready": False,
+    "ollama_connected": False,
+    "warmed_models": [],
+    "attempts": 0,
+    "started_at": None,
+    "last_checked_at": None,
+    "error": None,
+}
+
+def warm_up_once() -> bool:
+    """Load every routed model; returns whether the primary MODEL is loaded"""
+    startup_state["attempts"] += 1
+    if not ollama_service.check_ollama_connection():
+        startup_state["ollama_connected"] = False
+        startup_state["error"] = "Ollama is not connected"
+        print("❌ Ollama is not connected")
+        print("Please make sure Ollama is running: ollama serve")
+        return False
+
+    startup_state["ollama_connected"] = True
+    print("✅ Ollama is connected")
+
+    # The primary model first, since readiness depends on it
+    models = [ollama_service.MODEL]
+    for task in ollama_service.load_model_routes():
+        model, _ = ollama_service.resolve_route(task)
+        if model not in models:
+            models.append(model)
+
+    warmed = []
+    for model in models:
+        print(f"Warming up model {model}...")
+        if ollama_service.warm_up_model(model):
+            warmed.append(model)
+            print(f"✅ Model {model} is loaded")
+        else:
+            print(f"⚠️  Model {model} could not be loaded")
+            print("Available models:", ollama_service.get_available_models())
+
+    startup_state["warmed_models"] = warmed
+    if ollama_service.MODEL not in warmed:
+        startup_state["error"] = f"Model {ollama_service.MODEL} could not be loaded"
+        return False
+
+    startup_state["error"] = None
+    return True
+
+def warm_up_models():
+    """
+    Keep the primary model loaded for the life of the process: retry with
+    backoff until it warms up, then re-check it periodically and warm it up
+    again if Ollama restarted or evicted it.
+    """
+    startup_state["started_at"] = datetime.now().isoformat()
+    delay = WARMUP_RETRY_MIN
+    while True:
+        try:
+            if startup_state["ready"] and ollama_service.is_model_loaded(ollama_service.MODEL):
+                ready = True
+            else:
+                startup_state["ready"] = False
+                ready = warm_up_once()
+        except Exception as e:
+            startup_state["error"] = str(e)
+            ready = False
+
+        startup_state["ready"] = ready
+        startup_state["last_checked_at"] = datetime.now().isoformat()
+        if ready:
+            delay = WARMUP_RETRY_MIN
+            time.sleep(READINESS_CHECK_INTERVAL)
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX)
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Start warming up models without blocking the server from binding"""
+    threading.Thread(target=warm_up_models, daemon=True).start()
+
+@app.on_event("startup")
+async def start_search_index():
+    """Load the chat search index, building it on first run, in the background"""
+    chat_manager.start_search_index()
+
+@app.on_event("startup")
+async def start_pending_jobs():
+    """Re-queue generation jobs interrupted by the last shutdown"""
+    resumed = job_manager.resume_jobs()
+    if resumed:
+        print(f"Resumed {resumed} generation job(s)")
+
 # Pydantic models for request/response validation
 class ChatRequest(BaseModel):
     prompt: str
@@ -84,6 +197,21 @@ async def health_check():
         model_available=ollama_service.check_model_availability()
     )
 
+@app.get("/api/python/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {
+        "status": "OK",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/python/ready")
+async def readiness_check():
+    """Readiness probe: Ollama is reachable and the models are loaded"""
+    if not startup_state["ready"]:
+        raise HTTPException(status_code=503, detail=startup_state)
+    return startup_state
+
 @app.post("/api/python/chat/stream")
 async def chat_stream(request: ChatRequest):
     """Stream chat responses from Ollama"""
@@ -96,7 +224,10 @@ async def chat_stream(request: ChatRequest):
             for chunk in ollama_service.ask_gemma_tutor(request.prompt, request.history):
                 full_response += chunk
                 # Send each chunk as Server-Sent Events
-                yield f"data: {json.dumps({'chunk': chunk, 'done': False})}\n\n"
+                serialize_start = time.perf_counter()
+                event = f"data: {json.dumps({'chunk': chunk, 'done': False})}\n\n"
+                tracing.add_time("sse.serialize", time.perf_counter() - serialize_start)
+                yield event
             
             # Send completion signal
             yield f"data: {json.dumps({'chunk': '', 'done': True, 'full_response': full_response})}\n\n"
@@ -125,11 +256,18 @@ async def chat_simple(request: ChatRequest):
 async def explain_flashcard(request: FlashcardExplainRequest):
     """Generate explanation for a flashcard"""
     try:
-        explanation = ollama_service.generate_flashcard_explanation(
-            request.question, request.answer, request.subject
+        explanation = response_store.get_response(
+            "flashcard_explanation",
+            question=request.question, answer=request.answer, subject=request.subject
         )
+        cached = explanation is not None
+        if not cached:
+            explanation = ollama_service.generate_flashcard_explanation(
+                request.question, request.answer, request.subject
+            )
         return {
             "explanation": explanation,
+            "cached": cached,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -154,11 +292,18 @@ async def generate_study_hints(request: StudyHintsRequest):
 async def explain_concept(request: ConceptExplainRequest):
     """Explain a concept simply"""
     try:
-        explanation = ollama_service.explain_concept_simply(
-            request.concept, request.subject, request.difficulty
+        explanation = response_store.get_response(
+            "concept_explanation",
+            concept=request.concept, subject=request.subject, difficulty=request.difficulty
         )
+        cached = explanation is not None
+        if not cached:
+            explanation = ollama_service.explain_concept_simply(
+                request.concept, request.subject, request.difficulty
+            )
         return {
             "explanation": explanation,
+            "cached": cached,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -191,6 +336,21 @@ async def ollama_status():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/python/ollama/routes")
+async def ollama_routes():
+    """Get the model and generation options each task is routed to"""
+    try:
+        routes = {}
+        for task in ollama_service.load_model_routes():
+            model, options = ollama_service.resolve_route(task)
+            routes[task] = {"model": model, "options": options}
+        return {
+            "routes": routes,
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/python/course/generate")
 async def generate_course(request: CourseGenerateRequest):
     """Generate a complete course structure"""
@@ -209,17 +369,123 @@ async def generate_course(request: CourseGenerateRequest):
 async def generate_lesson_content(request: LessonGenerateRequest):
     """Generate detailed content for a specific lesson"""
     try:
-        lesson_content = ollama_service.generate_lesson_content(
-            request.lesson_title, request.course_topic, request.subject, 
-            request.difficulty, request.lesson_number
+        lesson_content = response_store.get_response(
+            "lesson_content",
+            lesson_title=request.lesson_title, course_topic=request.course_topic,
+            subject=request.subject, difficulty=request.difficulty,
+            lesson_number=request.lesson_number
         )
+        cached = lesson_content is not None
+        if not cached:
+            lesson_content = ollama_service.generate_lesson_content(
+                request.lesson_title, request.course_topic, request.subject, 
+                request.difficulty, request.lesson_number
+            )
         return {
             "content": lesson_content,
+            "cached": cached,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/python/jobs/course")
+async def submit_course_job(request: CourseGenerateRequest):
+    """Queue course generation and return the job immediately"""
+    try:
+        job = job_manager.submit_job("course", request.model_dump())
+        return {
+            "job": job,
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/python/jobs/lesson")
+async def submit_lesson_job(request: LessonGenerateRequest):
+    """Queue lesson content generation and return the job immediately"""
+    try:
+        job = job_manager.submit_job("lesson", request.model_dump())
+        return {
+            "job": job,
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/python/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a generation job's status, progress and result"""
+    job = job_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job": job,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/python/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream a job's updates until it completes or fails"""
+    if job_manager.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def generate():
+        last_update = None
+        while True:
+            job = job_manager.get_job(job_id)
+            if job is None:
+                break
+            if job["updatedAt"] != last_update:
+                last_update = job["updatedAt"]
+                done = job["status"] in ("completed", "failed")
+                yield f"data: {json.dumps({'job': job, 'done': done})}\n\n"
+                if done:
+                    break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(generate(), media_type="text/plain")
+
+@app.get("/api/python/chats/search")
+async def search_chats(
+    q: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Search chat names and messages"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query is required")
+    
+    try:
+        results = await run_in_threadpool(chat_manager.search_chats, q, page, page_size)
+        results["timestamp"] = datetime.now().isoformat()
+        return results
+    except chat_manager.SearchIndexBuilding as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject the request unless it carries the admin token"""
+    # Constant-time comparison so the token can't be guessed from timings
+    if not tracing.ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(
+        x_admin_token.encode('utf-8'), tracing.ADMIN_TOKEN.encode('utf-8')
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/api/python/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(seconds: float = Query(10, gt=0, le=tracing.PROFILE_MAX_SECONDS)):
+    """Run the sampling profiler for a number of seconds (admin only)"""
+    state = tracing.start_profiler(seconds)
+    if state is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return state
+
+@app.get("/api/python/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile_status():
+    """Get the state of the current or last profile (admin only)"""
+    return tracing.profiler_status()
+
 @app.get("/api/python/test")
 async def test_endpoint():
     """Test endpoint for debugging"""
@@ -236,18 +502,7 @@ if __name__ == "__main__":
     import uvicorn
     
     print("Starting Python FastAPI backend server...")
-    print("Testing Ollama connection...")
-    
-    if ollama_service.check_ollama_connection():
-        print("✅ Ollama is connected")
-        if ollama_service.check_model_availability():
-            print(f"✅ Model {ollama_service.MODEL} is available")
-        else:
-            print(f"⚠️  Model {ollama_service.MODEL} is not available")
-            print("Available models:", ollama_service.get_available_models())
-    else:
-        print("❌ Ollama is not connected")
-        print("Please make sure Ollama is running: ollama serve")
+    print("Models will be warmed up in the background")
     
     print(f"\nStarting FastAPI server on http://localhost:8000")
     print(f"API Documentation: http://localhost:8000/docs")
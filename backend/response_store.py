@@ -0,0 +1,125 @@
+import json
+import os
+import hashlib
+from typing import Dict, Any, Optional, Iterable, Set, Tuple
+from datetime import datetime
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+RESPONSES_FILE = os.path.join(DATA_DIR, 'responses.json')
+
+# In-memory copy of the store, reloaded when the file changes on disk.
+# `sources` maps (source, kind) to the entry key; `dirty` marks unsaved puts.
+_cache = {"mtime": None, "responses": {}, "sources": {}, "dirty": False}
+
+def make_key(kind: str, **params: Any) -> str:
+    """Build a stable key from the task kind and the inputs that shape its prompt"""
+    normalized = {k: str(v).strip() for k, v in params.items()}
+    payload = json.dumps([kind, normalized], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _index_sources(responses: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], str]:
+    return {(v.get('source'), v.get('kind')): k for k, v in responses.items()}
+
+def load_responses() -> Dict[str, Dict[str, Any]]:
+    """Load all stored responses from JSON file"""
+    # Unsaved puts win over the file until they are flushed
+    if _cache["dirty"]:
+        return _cache["responses"]
+
+    try:
+        mtime = os.stat(RESPONSES_FILE).st_mtime_ns
+    except OSError:
+        return _cache["responses"]
+
+    if _cache["mtime"] == mtime:
+        return _cache["responses"]
+
+    try:
+        with open(RESPONSES_FILE, 'r') as f:
+            responses = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _cache["responses"]
+
+    _cache["mtime"] = mtime
+    _cache["responses"] = responses
+    _cache["sources"] = _index_sources(responses)
+    return responses
+
+def save_responses(responses: Dict[str, Dict[str, Any]]) -> bool:
+    """Save all stored responses to JSON file"""
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+
+        # Write to a temp file first so a reader never sees a partial store
+        tmp_file = f"{RESPONSES_FILE}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(responses, f, ensure_ascii=False)
+        os.replace(tmp_file, RESPONSES_FILE)
+
+        _cache["mtime"] = os.stat(RESPONSES_FILE).st_mtime_ns
+        _cache["responses"] = responses
+        _cache["sources"] = _index_sources(responses)
+        _cache["dirty"] = False
+        return True
+    except Exception as e:
+        print(f"Error saving responses: {e}")
+        return False
+
+def flush() -> bool:
+    """Write responses stored with put_response to disk, if there are any"""
+    if not _cache["dirty"]:
+        return True
+    return save_responses(_cache["responses"])
+
+def get_response(kind: str, **params: Any) -> Optional[str]:
+    """Get a stored response for these inputs, if one was generated"""
+    entry = load_responses().get(make_key(kind, **params))
+    return entry.get('response') if entry else None
+
+def put_response(kind: str, source: str, response: str, model: str, **params: Any) -> Dict[str, Any]:
+    """
+    Store a generated response in memory; call flush() to write it out.
+
+    `source` identifies the content item (e.g. "flashcard:sample-1"); any older
+    entry for the same source and kind is dropped, since its text has changed.
+    """
+    responses = load_responses()
+    key = make_key(kind, **params)
+
+    old_key = _cache["sources"].get((source, kind))
+    if old_key is not None and old_key != key:
+        responses.pop(old_key, None)
+
+    entry = {
+        'kind': kind,
+        'source': source,
+        'params': params,
+        'response': response,
+        'model': model,
+        'generatedAt': datetime.now().isoformat()
+    }
+    responses[key] = entry
+    _cache["sources"][(source, kind)] = key
+    _cache["dirty"] = True
+    return entry
+
+def prune_sources(kinds: Iterable[str], keep: Set[Tuple[str, str]]) -> int:
+    """
+    Drop entries of the given kinds whose (source, kind) is not in `keep`,
+    i.e. content that was removed. Call flush() to write the result.
+    """
+    kinds = set(kinds)
+    responses = load_responses()
+    stale = [k for k, v in responses.items()
+             if v.get('kind') in kinds and (v.get('source'), v.get('kind')) not in keep]
+    for key in stale:
+        entry = responses.pop(key)
+        _cache["sources"].pop((entry.get('source'), entry.get('kind')), None)
+    if stale:
+        _cache["dirty"] = True
+    return len(stale)
+
+def has_response(kind: str, **params: Any) -> bool:
+    """Check whether a response for these inputs is already stored"""
+    return make_key(kind, **params) in load_responses()
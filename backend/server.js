@@ -361,6 +361,50 @@ const readChats = async () => {
   }
 };
 
+// Append-only feed of chat changes, read by the Python search index
+const CHAT_CHANGES_FILE = path.join(DATA_DIR, 'chat-changes.jsonl');
+// Held around each append; the search index takes it before replacing the feed
+const CHAT_CHANGES_LOCK = path.join(DATA_DIR, 'chat-changes.lock');
+// A lock older than this was left by a process that died holding it
+const FEED_LOCK_STALE_MS = 30000;
+let chatChangesQueue = Promise.resolve();
+
+// Helper function to run fn while holding the feed lock (mkdir is atomic)
+const withFeedLock = async (fn) => {
+  for (;;) {
+    try {
+      await fs.mkdir(CHAT_CHANGES_LOCK);
+      break;
+    } catch (error) {
+      if (error.code !== 'EEXIST') throw error;
+      try {
+        const stats = await fs.stat(CHAT_CHANGES_LOCK);
+        if (Date.now() - stats.mtimeMs > FEED_LOCK_STALE_MS) {
+          await fs.rmdir(CHAT_CHANGES_LOCK);
+          continue;
+        }
+      } catch (statError) {
+        // Released between mkdir and stat; try again
+      }
+      await new Promise((resolve) => setTimeout(resolve, 5));
+    }
+  }
+  try {
+    return await fn();
+  } finally {
+    await fs.rmdir(CHAT_CHANGES_LOCK).catch(() => {});
+  }
+};
+
+// Helper function to record a chat change; appends are serialized so
+// lines never interleave
+const recordChatChange = (change) => {
+  chatChangesQueue = chatChangesQueue
+    .then(() => withFeedLock(() => fs.appendFile(CHAT_CHANGES_FILE, JSON.stringify(change) + '\n')))
+    .catch((error) => console.error('Error recording chat change:', error));
+  return chatChangesQueue;
+};
+
 // Helper function to write chats
 const writeChats = async (chats) => {
   try {
@@ -416,6 +460,8 @@ app.post('/api/chats', async (req, res) => {
     return res.status(500).json({ error: 'Failed to save chat' });
   }
 
+  await recordChatChange({ op: 'put', chat: newChat });
+
   res.status(201).json(newChat);
 });
 
@@ -443,6 +489,8 @@ app.put('/api/chats/:id', async (req, res) => {
     return res.status(500).json({ error: 'Failed to update chat' });
   }
 
+  await recordChatChange({ op: 'put', chat: chats[chatIndex] });
+
   res.json(chats[chatIndex]);
 });
 
@@ -462,6 +510,8 @@ app.delete('/api/chats/:id', async (req, res) => {
     return res.status(500).json({ error: 'Failed to delete chat' });
   }
 
+  await recordChatChange({ op: 'delete', chatId: id });
+
   res.json({ message: 'Chat deleted successfully' });
 });
 
@@ -497,6 +547,8 @@ app.post('/api/chats/:id/messages', async (req, res) => {
     return res.status(500).json({ error: 'Failed to add message' });
   }
 
+  await recordChatChange({ op: 'message', chatId: id, message: newMessage });
+
   res.status(201).json(newMessage);
 });
 
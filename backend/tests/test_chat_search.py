@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import random
+
+import pytest
+
+import chat_manager
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_manager, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(chat_manager, "CHATS_FILE", str(tmp_path / "chats.json"))
+    monkeypatch.setattr(chat_manager, "CHAT_CHANGES_FILE", str(tmp_path / "chat-changes.jsonl"))
+    monkeypatch.setattr(chat_manager, "CHAT_CHANGES_LOCK", str(tmp_path / "chat-changes.lock"))
+    monkeypatch.setattr(chat_manager, "SEARCH_INDEX_FILE", str(tmp_path / "chat-index.bin"))
+    monkeypatch.setattr(chat_manager, "SEARCH_TEXT_FILE", str(tmp_path / "chat-index-text"))
+    monkeypatch.setattr(chat_manager, "_index", None)
+    monkeypatch.setattr(chat_manager, "_maintenance", {"thread": None, "rebuild": False, "retryAt": 0.0})
+
+    yield tmp_path
+
+    wait_for_maintenance()
+    if chat_manager._index is not None:
+        chat_manager._index["text"].close()
+
+
+def wait_for_maintenance():
+    thread = chat_manager._maintenance["thread"]
+    if thread is not None:
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+def search(query, **kwargs):
+    """Search, waiting out a first build or a pending rebuild"""
+    for _ in range(3):
+        try:
+            result = chat_manager.search_chats(query, **kwargs)
+        except chat_manager.SearchIndexBuilding:
+            wait_for_maintenance()
+            continue
+        if not chat_manager._maintenance["rebuild"]:
+            return result
+        wait_for_maintenance()
+    raise AssertionError("Search index was never built")
+
+
+def hits(query, **kwargs):
+    return {(hit["chatId"], hit["messageId"]) for hit in search(query, **kwargs)["results"]}
+
+
+def restart():
+    """Drop the in-memory index as if the server process had stopped"""
+    wait_for_maintenance()
+    chat_manager._index["text"].close()
+    chat_manager._index = None
+
+
+def add_chat(chat_id, name, *contents):
+    chat_manager.create_chat({"id": chat_id, "name": name, "messages": []})
+    for i, content in enumerate(contents):
+        chat_manager.add_message_to_chat(chat_id, {"id": f"{chat_id}-m{i}", "role": "user", "content": content})
+
+
+def test_incremental_changes(data_dir):
+    add_chat("c1", "Cell biology", "What do mitochondria do?")
+    assert hits("mitochondria") == {("c1", "c1-m0")}
+
+    # Changes after the first build are read from the feed
+    add_chat("c2", "Optics", "Why does light refract in water?")
+    chat_manager.add_message_to_chat("c1", {"id": "c1-m1", "role": "assistant",
+                                            "content": "Mitochondria make ATP for the cell."})
+    assert hits("mitochondria") == {("c1", "c1-m0"), ("c1", "c1-m1")}
+    assert hits("refract") == {("c2", "c2-m0")}
+    assert search("optics")["results"][0]["field"] == "name"
+
+    chat = chat_manager.get_chat_by_id("c1")
+    chat["name"] = "Organelles"
+    chat["messages"][0]["content"] = "What do ribosomes do?"
+    chat_manager.update_chat("c1", chat)
+    assert hits("mitochondria") == {("c1", "c1-m1")}
+    assert hits("ribosomes") == {("c1", "c1-m0")}
+    assert hits("biology") == set()
+    assert search("ribosomes")["results"][0]["chatName"] == "Organelles"
+
+    chat_manager.delete_chat("c2")
+    assert hits("refract") == set()
+
+    # Lines appended by the Node server are picked up the same way
+    node_chat = {"id": "c3", "name": "Node chat", "messages": [{"id": "n1", "content": "Refraction again"}]}
+    with open(chat_manager.CHAT_CHANGES_FILE, "a") as f:
+        f.write(json.dumps({"op": "put", "chat": node_chat}) + "\n")
+        f.write('{"op": "message", "chatId": "c3"')
+    assert hits("refraction") == {("c3", "n1")}
+
+
+def test_search_after_snapshot_reload(data_dir, monkeypatch):
+    add_chat("c1", "Cell biology", "What do mitochondria do?")
+    assert search("mitochondria")["total"] == 1
+
+    # Compact after every change so the snapshot holds a merged base
+    monkeypatch.setattr(chat_manager, "COMPACT_DELTA_DOCS", 1)
+    add_chat("c2", "Optics", "Light bends in water")
+    assert search("light")["total"] == 1
+    wait_for_maintenance()
+    chat_manager.delete_chat("c1")
+    add_chat("c3", "Waves", "Light is a wave")
+    assert search("light")["total"] == 2
+    wait_for_maintenance()
+    monkeypatch.setattr(chat_manager, "COMPACT_DELTA_DOCS", 20000)
+
+    # Changes after the last snapshot come back from the feed
+    chat_manager.add_message_to_chat("c2", {"id": "c2-m1", "content": "Light slows down in glass"})
+
+    def fail():
+        raise AssertionError("the snapshot should load without a rebuild")
+
+    restart()
+    monkeypatch.setattr(chat_manager, "_rebuild_index", fail)
+    assert hits("light") == {("c2", "c2-m0"), ("c2", "c2-m1"), ("c3", "c3-m0")}
+    assert hits("mitochondria") == set()
+    assert search("waves")["results"][0]["chatName"] == "Waves"
+
+    # Deleting a chat that only exists in the loaded snapshot
+    chat_manager.delete_chat("c3")
+    assert hits("light") == {("c2", "c2-m0"), ("c2", "c2-m1")}
+
+
+@pytest.mark.parametrize("damage", ["replace", "truncate"])
+def test_recovers_from_damaged_feed(data_dir, damage):
+    add_chat("c1", "Cell biology", "What do mitochondria do?")
+    add_chat("c2", "Optics", "Light bends in water")
+    assert search("light")["total"] == 1
+
+    # Edit chats.json behind the index's back and lose the feed
+    chats = chat_manager.load_chats()
+    chats[1]["messages"][0]["content"] = "Lenses focus light"
+    chat_manager.save_chats(chats)
+    if damage == "replace":
+        os.remove(chat_manager.CHAT_CHANGES_FILE)
+        with open(chat_manager.CHAT_CHANGES_FILE, "w") as f:
+            f.write("")
+    else:
+        with open(chat_manager.CHAT_CHANGES_FILE, "r+") as f:
+            f.truncate(10)
+
+    assert hits("lenses") == {("c2", "c2-m0")}
+    assert hits("bends") == set()
+
+    chat_manager.delete_chat("c1")
+    assert hits("mitochondria") == set()
+
+
+def test_paging_and_snippets(data_dir):
+    filler = "word " * 40
+    add_chat("c1", "Photosynthesis", *[f"{filler}photosynthesis step {i} {filler}" for i in range(25)])
+
+    first = search("photosynthesis", page=1, page_size=10)
+    second = search("photosynthesis", page=2, page_size=10)
+    third = search("photosynthesis", page=3, page_size=10)
+    assert first["total"] == 26
+    assert not first["totalIsEstimate"]
+    assert [len(page["results"]) for page in (first, second, third)] == [10, 10, 6]
+
+    ids = [hit["messageId"] for page in (first, second, third) for hit in page["results"]]
+    assert len(set(ids)) == 26
+    scores = [hit["score"] for page in (first, second, third) for hit in page["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+    # The chat name is short, so it ranks first
+    assert first["results"][0]["field"] == "name"
+    assert first["results"][0]["snippet"] == "**Photosynthesis**"
+
+    snippet = second["results"][0]["snippet"]
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert "**photosynthesis**" in snippet
+
+
+def test_ranking_matches_exhaustive_scoring(data_dir, monkeypatch):
+    # Small blocks so most queries stop before reading every posting
+    monkeypatch.setattr(chat_manager, "SEARCH_BLOCK", 4)
+    monkeypatch.setattr(chat_manager, "SEARCH_RESOLVE_LIMIT", 8)
+    rng = random.Random(7)
+    vocabulary = [f"w{i}" for i in range(300)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def text(low, high):
+        return " ".join(rng.choices(vocabulary, weights, k=rng.randint(low, high)))
+
+    chats = [{"id": f"c{i}", "name": text(1, 4),
+              "messages": [{"id": f"c{i}-m{j}", "content": text(3, 40)} for j in range(8)]}
+             for i in range(60)]
+    chat_manager.save_chats(chats[:40])
+    search("w0")
+    for chat in chats[40:]:
+        chat_manager.create_chat(chat)
+
+    index = chat_manager._index
+    docs = {}
+    for chat in chats:
+        docs[(chat["id"], None)] = (chat_manager.DOC_NAME, chat["name"])
+        for message in chat["messages"]:
+            docs[(chat["id"], message["id"])] = (chat_manager.DOC_MESSAGE, message["content"])
+
+    def expected(terms):
+        counts = {key: chat_manager._term_counts(doc_text) for key, (_, doc_text) in docs.items()}
+        scores = {key: 0.0 for key in docs}
+        for term in terms:
+            df = sum(1 for term_counts, _ in counts.values() if term in term_counts)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            for key, (term_counts, length) in counts.items():
+                if term in term_counts:
+                    impact = chat_manager._impact(index, term_counts[term], length, docs[key][0])
+                    scores[key] += idf * chat_manager.MAX_WEIGHT / chat_manager.IMPACT_LEVELS * impact
+        matched = sorted((score for score in scores.values() if score > 0), reverse=True)
+        return matched
+
+    for query in ["w0", "w0 w1", "w0 w2 w40", "w3 w250", "w1 w5 w9 w17"]:
+        terms = query.split()
+        matched = expected(terms)
+        for page in (1, 3):
+            result = search(query, page=page, page_size=10)
+            assert [hit["score"] for hit in result["results"]] == \
+                [round(score, 4) for score in matched[(page - 1) * 10:page * 10]]
+            if not result["totalIsEstimate"]:
+                assert result["total"] == len(matched)
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import job_manager
+import ollama_service
+import response_store
+
+COURSE = {"topic": "Optics", "subject": "Physics", "difficulty": "beginner", "lessons_count": 2}
+LESSON = {"lesson_title": "Refraction", "course_topic": "Optics", "subject": "Physics",
+          "difficulty": "beginner", "lesson_number": 1}
+COURSE_JSON = '{"title": "Optics", "description": "Light", "lessons": []}'
+
+
+class StubOllama:
+    """Stands in for ask_gemma_tutor, replying with queued lists of chunks"""
+
+    def __init__(self):
+        self.replies = []
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, prompt, conversation_history=None, task="chat"):
+        self.calls += 1
+        self.release.wait(5)
+        yield from self.replies.pop(0)
+
+
+@pytest.fixture
+def ollama(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_manager, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(job_manager, "JOBS_FILE", str(tmp_path / "jobs.json"))
+    monkeypatch.setattr(job_manager, "JOB_OUTPUT_DIR", str(tmp_path / "job-output"))
+    monkeypatch.setattr(job_manager, "_jobs", None)
+    monkeypatch.setattr(job_manager, "_executor", None)
+    monkeypatch.setattr(job_manager, "_partial", {})
+
+    stub = StubOllama()
+    monkeypatch.setattr(ollama_service, "ask_gemma_tutor", stub)
+    monkeypatch.setattr(ollama_service, "resolve_route", lambda task: ("stub-model", {"num_predict": 4}))
+    monkeypatch.setattr(response_store, "get_response", lambda kind, **params: None)
+
+    yield stub
+
+    stub.release.set()
+    if job_manager._executor is not None:
+        job_manager._executor.shutdown(wait=True)
+
+
+def wait_for(job_id, statuses=job_manager.FINISHED_STATUSES, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_manager.get_job(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish: {job}")
+
+
+def restart():
+    """Drop in-memory state as if the server process had stopped"""
+    job_manager._executor.shutdown(wait=True)
+    job_manager._executor = None
+    job_manager._jobs = None
+    job_manager._partial.clear()
+
+
+def test_identical_submissions_share_a_job(ollama):
+    ollama.replies.append(["# Refraction", " bends light"])
+    ollama.release.clear()
+
+    first = job_manager.submit_job("lesson", dict(LESSON))
+    second = job_manager.submit_job("lesson", dict(LESSON))
+    assert second["id"] == first["id"]
+
+    ollama.release.set()
+    job = wait_for(first["id"])
+    assert job["status"] == "completed"
+    assert job["result"] == "# Refraction bends light"
+    assert "partialOutput" not in job
+
+    third = job_manager.submit_job("lesson", dict(LESSON))
+    assert third["id"] == first["id"]
+    assert third["status"] == "completed"
+    assert ollama.calls == 1
+
+
+def test_failed_job_is_requeued_under_same_id(ollama):
+    ollama.replies.append(["# Refr", "Error connecting to Ollama: connection refused"])
+    first = job_manager.submit_job("lesson", dict(LESSON))
+    job = wait_for(first["id"])
+    assert job["status"] == "failed"
+    assert "connection refused" in job["error"]
+    assert job["partialOutput"].startswith("# Refr")
+
+    ollama.replies.append(["# Refraction"])
+    again = job_manager.submit_job("lesson", dict(LESSON))
+    assert again["id"] == first["id"]
+    assert again["status"] == "queued"
+    assert again["partialOutput"] == ""
+
+    job = wait_for(first["id"])
+    assert job["status"] == "completed"
+    assert job["result"] == "# Refraction"
+    assert ollama.calls == 2
+
+
+def test_resume_jobs_after_restart(ollama):
+    ollama.replies.append(["# Refraction"])
+    first = job_manager.submit_job("lesson", dict(LESSON))
+    wait_for(first["id"])
+    restart()
+
+    # Simulate a crash mid-stream: the store still says running and the
+    # output file holds what was streamed so far
+    with open(job_manager.JOBS_FILE) as f:
+        stored = json.load(f)
+    stored[0].update(status="running", result=None, finishedAt=None)
+    with open(job_manager.JOBS_FILE, "w") as f:
+        json.dump(stored, f)
+    os.makedirs(job_manager.JOB_OUTPUT_DIR, exist_ok=True)
+    with open(job_manager._output_path(first["id"]), "w", encoding="utf-8") as f:
+        f.write("# Refr")
+
+    assert job_manager.get_job(first["id"])["partialOutput"] == "# Refr"
+
+    ollama.replies.append(["# Refraction", " resumed"])
+    assert job_manager.resume_jobs() == 1
+    job = wait_for(first["id"])
+    assert job["status"] == "completed"
+    assert job["result"] == "# Refraction resumed"
+    assert not os.path.exists(job_manager._output_path(first["id"]))
+
+
+@pytest.mark.parametrize("chunks", [
+    ["Error: Ollama API returned status 500"],
+    ['{"title": "Opt', "Error connecting to Ollama: read timed out"],
+    ["Sorry, I can't help with that."],
+])
+def test_course_errors_fail_the_job(ollama, chunks):
+    ollama.replies.append(chunks)
+    first = job_manager.submit_job("course", dict(COURSE))
+    job = wait_for(first["id"])
+    assert job["status"] == "failed"
+    assert job["result"] is None
+
+    # The placeholder course is never kept, so a retry runs again
+    ollama.replies.append([COURSE_JSON])
+    job_manager.submit_job("course", dict(COURSE))
+    job = wait_for(first["id"])
+    assert job["status"] == "completed"
+    assert job["result"] == json.loads(COURSE_JSON)
+
+
+def test_finished_jobs_expire(ollama):
+    ollama.replies.append(["# Refraction"])
+    old = wait_for(job_manager.submit_job("lesson", dict(LESSON))["id"])
+    finished = datetime.now() - timedelta(seconds=job_manager.JOB_RETENTION_SECONDS + 60)
+    job_manager._update_job(old["id"], finishedAt=finished.isoformat())
+
+    ollama.replies.append([COURSE_JSON])
+    job_manager.submit_job("course", dict(COURSE))
+
+    assert job_manager.get_job(old["id"]) is None
+    with open(job_manager.JOBS_FILE) as f:
+        assert old["id"] not in [job["id"] for job in json.load(f)]
@@ -0,0 +1,25 @@
+import requests
+
+import ollama_service
+
+
+def test_empty_model_list_is_cached(monkeypatch):
+    calls = []
+
+    def get(url, timeout=None):
+        calls.append(timeout)
+        raise requests.exceptions.ConnectionError("Ollama is down")
+
+    monkeypatch.setattr(ollama_service.requests, "get", get)
+    monkeypatch.setattr(ollama_service, "_models_cache", {"models": [], "fetched_at": None})
+
+    for _ in range(3):
+        assert ollama_service.resolve_route("chat")[0] == ollama_service.MODEL
+
+    assert len(calls) == 1
+    assert calls[0] is not None
+
+    monkeypatch.setattr(ollama_service.time, "time", lambda: ollama_service._models_cache["fetched_at"]
+                        + ollama_service.MODELS_CACHE_TTL + 1)
+    ollama_service.resolve_route("chat")
+    assert len(calls) == 2
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import ollama_service
+import prewarm_cache
+import response_store
+
+CARD = {"id": "card-1", "question": "What does ATP stand for?", "answer": "Adenosine triphosphate",
+        "subject": "Biology"}
+
+
+@pytest.fixture
+def replies(tmp_path, monkeypatch):
+    flashcards = tmp_path / "flashcards.json"
+    flashcards.write_text(json.dumps([CARD]))
+    monkeypatch.setattr(prewarm_cache, "FLASHCARDS_FILE", str(flashcards))
+    monkeypatch.setattr(prewarm_cache, "COURSES_FILE", str(tmp_path / "courses.json"))
+    monkeypatch.setattr(prewarm_cache, "BOSS_CHALLENGES_FILE", str(tmp_path / "boss-challenges.json"))
+    monkeypatch.setattr(response_store, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(response_store, "RESPONSES_FILE", str(tmp_path / "responses.json"))
+    monkeypatch.setattr(response_store, "_cache", {"mtime": None, "responses": {}, "sources": {}, "dirty": False})
+
+    queued = []
+
+    def ask_gemma_tutor(prompt, conversation_history=None, task="chat"):
+        yield from queued.pop(0)
+
+    monkeypatch.setattr(ollama_service, "ask_gemma_tutor", ask_gemma_tutor)
+    monkeypatch.setattr(ollama_service, "resolve_route", lambda task: ("stub-model", {}))
+    return queued
+
+
+def run():
+    return prewarm_cache.run(["flashcard_explanation"], delay=0)
+
+
+@pytest.mark.parametrize("chunks", [
+    ["Unexpected error: model crashed"],
+    ["ATP is the cell's", "Error connecting to Ollama: read timed out"],
+])
+def test_error_responses_are_not_stored(replies, chunks):
+    replies.append(chunks)
+    stats = run()
+    assert stats["failed"] == 1
+    assert stats["generated"] == 0
+    assert not response_store.has_response("flashcard_explanation", question=CARD["question"],
+                                           answer=CARD["answer"], subject=CARD["subject"])
+
+    # The next run retries the item instead of skipping it
+    replies.append(["ATP is the cell's ", "energy currency."])
+    stats = run()
+    assert stats["generated"] == 1
+    assert response_store.get_response("flashcard_explanation", question=CARD["question"],
+                                       answer=CARD["answer"], subject=CARD["subject"]) \
+        == "ATP is the cell's energy currency."
@@ -0,0 +1,194 @@
+"""
+Per-request trace spans and a sampling profiler.
+
+Free of web framework imports so service modules can record spans; the
+ASGI middleware and route class live in tracing_middleware.py.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+
+# Path to log files
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+TRACES_FILE = os.path.join(LOGS_DIR, 'traces.jsonl')
+
+# Fraction of requests whose spans are written; slow requests are always kept
+TRACE_SAMPLE_RATE = float(os.environ.get('STEM_TRACE_SAMPLE_RATE', '0.1'))
+TRACE_SLOW_MS = float(os.environ.get('STEM_TRACE_SLOW_MS', '5000'))
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUP_COUNT = 5
+
+TRACE_HEADER = 'x-trace-id'
+
+# Admin endpoints are disabled unless this token is set
+ADMIN_TOKEN = os.environ.get('STEM_ADMIN_TOKEN')
+
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 300
+
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar('current_trace', default=None)
+_trace_logger: Optional[logging.Logger] = None
+_profiler_lock = threading.Lock()
+_profiler_state = {"running": False, "output": None, "startedAt": None}
+
+def _get_trace_logger() -> logging.Logger:
+    """Create the rotating JSONL trace logger on first use"""
+    global _trace_logger
+    if _trace_logger is None:
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        handler = RotatingFileHandler(
+            TRACES_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger('stem_forge.traces')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        _trace_logger = logger
+    return _trace_logger
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    """Get the trace of the request being handled, if any"""
+    return _current_trace.get()
+
+def start_trace(name: str, trace_id: Optional[str] = None) -> Dict[str, Any]:
+    """Start a trace for a request and make it current"""
+    trace = {
+        "traceId": trace_id or uuid.uuid4().hex,
+        "name": name,
+        "startedAt": datetime.now().isoformat(),
+        "sampled": random.random() < TRACE_SAMPLE_RATE,
+        "spans": [],
+        "totals": {},
+        "_start": time.perf_counter(),
+        "_marks": {},
+    }
+    _current_trace.set(trace)
+    return trace
+
+def finish_trace(trace: Dict[str, Any], status: Optional[int] = None):
+    """Close a trace and write it out if it was sampled or slow"""
+    duration_ms = (time.perf_counter() - trace["_start"]) * 1000
+    if not trace["sampled"] and duration_ms < TRACE_SLOW_MS:
+        return
+
+    record = {k: v for k, v in trace.items() if not k.startswith('_')}
+    record["status"] = status
+    record["durationMs"] = round(duration_ms, 3)
+    record["totals"] = {k: round(v, 3) for k, v in trace["totals"].items()}
+    try:
+        _get_trace_logger().info(json.dumps(record, ensure_ascii=False))
+    except Exception as e:
+        print(f"Error writing trace: {e}")
+
+def record_span(name: str, start: float, end: float, **attrs: Any):
+    """Add a span measured with time.perf_counter() to the current trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace["spans"].append({
+        "name": name,
+        "startMs": round((start - trace["_start"]) * 1000, 3),
+        "durationMs": round((end - start) * 1000, 3),
+        **attrs
+    })
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """Time a block of code as a span of the current trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter(), **attrs)
+
+def add_time(name: str, seconds: float):
+    """
+    Accumulate time for a stage that runs many short times per request
+    (e.g. parsing each streamed line), reported as a single total.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["totals"][name] = trace["totals"].get(name, 0.0) + seconds * 1000
+
+def mark(name: str):
+    """Remember the current time under a name for a later span"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["_marks"][name] = time.perf_counter()
+
+def span_since(mark_name: str, name: str, **attrs: Any):
+    """Record a span from an earlier mark until now"""
+    trace = _current_trace.get()
+    if trace is not None and mark_name in trace["_marks"]:
+        record_span(name, trace["_marks"].pop(mark_name), time.perf_counter(), **attrs)
+
+def _run_profiler(seconds: float, output: str):
+    """Sample every thread's stack and write them in collapsed-stack format"""
+    counts: Dict[Tuple[Tuple[str, str, int], ...], int] = {}
+    own_thread = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    samples = 0
+
+    try:
+        while time.monotonic() < deadline:
+            # Only raw frame fields are read while sampling; formatting the
+            # stacks (and anything touching source files) waits until the end
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code.co_filename, frame.f_code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                key = tuple(stack)
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(PROFILE_INTERVAL)
+
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        with open(output, 'w') as f:
+            for stack, count in sorted(counts.items(), key=lambda item: -item[1]):
+                key = ";".join(f"{name} ({os.path.basename(filename)}:{lineno})"
+                               for filename, name, lineno in reversed(stack))
+                f.write(f"{key} {count}\n")
+        print(f"Profile with {samples} samples written to {output}")
+    except Exception as e:
+        print(f"Error running profiler: {e}")
+    finally:
+        with _profiler_lock:
+            _profiler_state["running"] = False
+
+def start_profiler(seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Run the sampling profiler in the background for `seconds`. Returns the
+    profiler state, or None if a profile is already being taken.
+    """
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    with _profiler_lock:
+        if _profiler_state["running"]:
+            return None
+        output = os.path.join(LOGS_DIR, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt")
+        _profiler_state.update({
+            "running": True,
+            "output": output,
+            "startedAt": datetime.now().isoformat(),
+            "seconds": seconds
+        })
+        threading.Thread(target=_run_profiler, args=(seconds, output), daemon=True).start()
+        return dict(_profiler_state)
+
+def profiler_status() -> Dict[str, Any]:
+    """Get the state of the current or last profile"""
+    with _profiler_lock:
+        return dict(_profiler_state)
@@ -0,0 +1,84 @@
+"""
+FastAPI side of tracing: the middleware that opens a trace per request and
+the route class that splits it into queue, validation and handler spans.
+"""
+import asyncio
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from tracing import TRACE_HEADER, start_trace, finish_trace, mark, span, span_since
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a trace per HTTP request, returns its id in
+    the X-Trace-Id header and closes it once the last body chunk is sent,
+    so streamed responses are timed to the end.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(TRACE_HEADER.encode())
+        trace = start_trace(
+            f"{scope['method']} {scope['path']}",
+            incoming.decode('latin-1')[:64] if incoming else None
+        )
+        mark("request")
+        state = {"status": None, "finished": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (TRACE_HEADER.encode(), trace["traceId"].encode())
+                ]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["finished"] = True
+                finish_trace(trace, state["status"])
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not state["finished"]:
+                finish_trace(trace, state["status"] or 500)
+
+class TracedRoute(APIRoute):
+    """
+    Route class that splits request handling into spans: "queue" from the
+    request arriving until the route runs, "validation" while FastAPI parses
+    and validates the body, and "handler" for the endpoint itself.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        original = endpoint
+
+        async def traced_endpoint(*args, **kw):
+            span_since("route", "validation")
+            with span("handler"):
+                if asyncio.iscoroutinefunction(original):
+                    return await original(*args, **kw)
+                return await run_in_threadpool(original, *args, **kw)
+
+        traced_endpoint.__name__ = original.__name__
+        traced_endpoint.__doc__ = original.__doc__
+        traced_endpoint.__wrapped__ = original
+        super().__init__(path, traced_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            span_since("request", "queue")
+            mark("route")
+            return await handler(request)
+
+        return traced_handler